@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+批量重评分 - 敏感词或评分规则变更后，按当前规则重新评估历史训练记录
+
+用法：
+    python scripts/rescore.py                # 全部记录
+    python scripts/rescore.py --days 30      # 最近 30 天
+    python scripts/rescore.py --workers 8
+"""
+import argparse
+import os
+import sys
+import time
+
+import yaml
+
+# 设置编码
+sys.stdout.reconfigure(encoding='utf-8')
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.agent.batch_eval import rescore_records
+from src.agent.storage import TrainingStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量重评分历史训练记录")
+    parser.add_argument('--config', default='config/agent.yaml', help='Agent 配置文件')
+    parser.add_argument('--days', type=int, default=None, help='只重评最近 N 天')
+    parser.add_argument('--workers', type=int, default=None, help='进程数（默认 CPU 核数）')
+    parser.add_argument('--chunk-size', type=int, default=500, help='每批记录数')
+    args = parser.parse_args()
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+
+    store = TrainingStore(config.get('storage') or {})
+    since = time.time() - args.days * 86400 if args.days else 0
+    started = time.time()
+
+    def progress(done, total):
+        percent = done * 100 / total if total else 100
+        print(f"\r重评分进度: {done}/{total} ({percent:.1f}%)", end='', flush=True)
+
+    count = rescore_records(
+        store,
+        config['evaluation'],
+        config['sensitive_words'],
+        since=since,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        progress=progress
+    )
+    store.close()
+    print(f"\n完成，共重评分 {count} 条记录，用时 {time.time() - started:.1f} 秒")
+
+
+if __name__ == "__main__":
+    main()
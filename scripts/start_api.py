@@ -8,9 +8,10 @@ sys.stdout.reconfigure(encoding='utf-8')
 # 添加项目路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.api.main import start_server
-
 if __name__ == "__main__":
+    # 在入口内导入：spawn 进程池的子进程会重新导入本脚本，不应随之创建 Agent
+    from src.api.main import start_server
+
     print("=" * 50)
     print("话术演练场 - AI 陪练系统")
     print("=" * 50)
@@ -1,5 +1,11 @@
 """Agent 模块"""
 
-from .coach_agent import DialogueCoachAgent, get_agent
-
 __all__ = ['DialogueCoachAgent', 'get_agent']
+
+
+def __getattr__(name):
+    # 按需导入：进程池工作进程（spawn）只加载用到的子模块，不导入整个 Agent
+    if name in __all__:
+        from . import coach_agent
+        return getattr(coach_agent, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
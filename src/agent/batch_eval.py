@@ -0,0 +1,167 @@
+"""
+批量重评分 - 敏感词或评分规则变更后，对历史对话重新评估并批量写回
+"""
+
+import json
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from .jobs import JobStore
+from .storage import TrainingStore
+from .tools.evaluation import EvaluationTool
+
+
+# 进程池工作进程内的评估器（每个进程初始化一次）
+_worker_tool: Optional[EvaluationTool] = None
+_worker_sensitive_words: List[str] = []
+
+
+def _init_worker(eval_config: dict, sensitive_words: List[str]):
+    global _worker_tool, _worker_sensitive_words
+    _worker_tool = EvaluationTool(eval_config)
+    _worker_sensitive_words = sensitive_words
+
+
+def _evaluate_chunk(rows: List[Tuple[int, str, str]]) -> List[dict]:
+    """在工作进程中评估一批对话"""
+    updates = []
+    for record_id, project, dialogue in rows:
+        evaluation = _worker_tool.evaluate(
+            dialogue_history=json.loads(dialogue),
+            project=project,
+            sensitive_words=_worker_sensitive_words,
+            include_summary=False
+        )
+        updates.append({
+            'id': record_id,
+            'total_score': evaluation['total_score'],
+            'dimensions': json.dumps(evaluation['dimensions'], ensure_ascii=False),
+            'highlights': json.dumps(evaluation['highlights'], ensure_ascii=False),
+            'improvements': json.dumps(evaluation['improvements'], ensure_ascii=False),
+            'suggestion': evaluation['suggestion']
+        })
+    return updates
+
+
+def rescore_records(store: TrainingStore, eval_config: dict, sensitive_words: List[str],
+                    since: float = 0, until: Optional[float] = None, workers: Optional[int] = None,
+                    chunk_size: int = 500,
+                    progress: Optional[Callable[[int, int], None]] = None) -> int:
+    """
+    重新评估时间范围内的训练记录
+
+    Args:
+        store: 训练记录存储
+        eval_config: agent.yaml 中的 evaluation 配置
+        sensitive_words: 敏感词列表
+        since / until: 记录时间范围（时间戳）
+        workers: 进程数，默认 CPU 核数
+        chunk_size: 每个任务的记录数，同时也是写回批次大小
+        progress: 进度回调 (已完成, 总数)
+
+    Returns:
+        重评分记录数
+    """
+    until = until or time.time()
+    total = store.count_records(since, until)
+    done = 0
+    if progress:
+        progress(done, total)
+
+    # spawn 启动：API 进程内有写线程、清理线程，fork 可能继承被占用的锁
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(eval_config, sensitive_words)) as pool:
+        # 读取、评估、写回流水线进行，在途任务数受限，内存占用与记录总数无关
+        in_flight = []
+        max_in_flight = (workers or 4) * 2
+        for rows in store.iter_dialogues(since, until, chunk_size=chunk_size):
+            in_flight.append(pool.submit(_evaluate_chunk, rows))
+            if len(in_flight) >= max_in_flight:
+                done += _write_back(store, in_flight.pop(0).result())
+                if progress:
+                    progress(done, total)
+        for future in in_flight:
+            done += _write_back(store, future.result())
+            if progress:
+                progress(done, total)
+
+    store.rebuild_rollups()
+    return done
+
+
+def _write_back(store: TrainingStore, updates: List[dict]) -> int:
+    store.update_scores(updates)
+    return len(updates)
+
+
+# 进度写入任务表的最小间隔（秒）
+PROGRESS_INTERVAL = 1.0
+
+
+class RescoreJob:
+    """后台重评分任务（状态写入共享的任务表，任一 worker 都能查询进度）"""
+
+    def __init__(self, store: TrainingStore, jobs: JobStore, eval_config: dict, sensitive_words: List[str],
+                 **options):
+        self.jobs = jobs
+        self.job_id = uuid.uuid4().hex[:12]
+        self.status = 'pending'
+        self.done = 0
+        self.total = 0
+        self.error = ''
+        self.started_at = None
+        self.finished_at = None
+        self._reported_at = 0.0
+        self._thread = threading.Thread(
+            target=self._run, args=(store, eval_config, sensitive_words), kwargs=options,
+            name=f'rescore-{self.job_id}', daemon=True
+        )
+
+    def start(self) -> bool:
+        """
+        登记并启动任务
+
+        Returns:
+            是否启动（任一 worker 上已有未结束的重评分任务时不启动）
+        """
+        if not self.jobs.create('rescore', self.to_dict(), exclusive=True):
+            return False
+        self._thread.start()
+        return True
+
+    def _run(self, store, eval_config, sensitive_words, **options):
+        self.status = 'running'
+        self.started_at = time.time()
+        self.jobs.update(self.to_dict())
+        try:
+            rescore_records(store, eval_config, sensitive_words, progress=self._progress, **options)
+            self.status = 'completed'
+        except Exception as e:
+            self.status = 'failed'
+            self.error = str(e)
+        self.finished_at = time.time()
+        self.jobs.update(self.to_dict())
+
+    def _progress(self, done: int, total: int):
+        self.done = done
+        self.total = total
+        now = time.monotonic()
+        if now - self._reported_at >= PROGRESS_INTERVAL:
+            self._reported_at = now
+            self.jobs.update(self.to_dict())
+
+    def to_dict(self) -> dict:
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'done': self.done,
+            'total': self.total,
+            'error': self.error,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
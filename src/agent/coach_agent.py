@@ -3,16 +3,26 @@
 基于 OpenClaw Agent 架构
 """
 
+import asyncio
 import json
 import yaml
-from typing import List, Dict, Optional
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
 from datetime import datetime
 from pathlib import Path
 
-from .tools.knowledge import KnowledgeTool
+from .tools.knowledge import DEFAULT_TENANT, KnowledgeTool
 from .tools.evaluation import EvaluationTool
 from .tools.scenario import ScenarioTool
+from .tools.scenario_catalog import ScenarioCatalog, scenario_id
 from .tools.notification import NotificationTool
+from .history import CONTENT, ROLE, HistoryManager, Role
+from .llm import create_llm_provider
+from .llm_cache import cache_key, create_response_cache, normalize
+from .responder import HybridResponder
+from .scenario_pool import create_scenario_pool
+from .jobs import JobStore
+from .session_store import SessionLocks, SessionStore, SessionSweeper, create_session_store
+from .storage import TrainingStore, build_record
 
 
 class DialogueCoachAgent:
@@ -25,11 +35,42 @@ class DialogueCoachAgent:
         # 初始化工具
         self.knowledge_tool = KnowledgeTool(self.config['knowledge_base'])
         self.evaluation_tool = EvaluationTool(self.config['evaluation'])
-        self.scenario_tool = ScenarioTool()
+        # 场景目录：按内容去重持久化，同一种子复现同一场景
+        catalog_config = self.config.get('scenario_catalog')
+        self.scenario_tool = ScenarioTool(
+            ScenarioCatalog(catalog_config['path'], catalog_config.get('max_scenarios', 10000)) if catalog_config else None
+        )
+        # 场景预生成池（未配置时每次开始训练当场生成）
+        self.scenario_pool = create_scenario_pool(self.scenario_tool, self.config.get('scenario_pool'))
         self.notification_tool = NotificationTool(self.config['channels'])
         
-        # 会话管理
-        self.active_sessions: Dict[str, dict] = {}
+        # 训练记录存储
+        self.training_store = TrainingStore(self.config.get('storage') or {})
+        # 后台任务状态（知识库导入、重评分），多个 worker 共享
+        self.job_store = JobStore(self.config.get('jobs'))
+        
+        # LLM（未配置时使用规则回复）
+        self.llm = create_llm_provider(self.config.get('llm'))
+        # 患者回应调度：LLM 超出延迟预算、失败或熔断时使用规则回复
+        self.responder = HybridResponder(self.llm, self.config.get('responder')) if self.llm is not None else None
+        # LLM 回复缓存（相同场景 + 对话前缀 + 咨询师回复直接复用）
+        self.response_cache = create_response_cache(self.config.get('llm_cache')) if self.llm is not None else None
+        
+        # 对话历史（紧凑表示、token 预算与滚动摘要）
+        self.history_manager = HistoryManager(self.config.get('history'))
+        
+        # 会话管理（内存或 SQLite，SQLite 支持多 worker 共享与重启恢复）
+        session_config = self.config.get('session') or {}
+        self.active_sessions: SessionStore = create_session_store(session_config)
+        self.evaluate_abandoned = session_config.get('evaluate_abandoned', False)
+        self.abandoned_evaluated = 0
+        self.active_sessions.on_evict = self._on_session_evicted
+        self.session_sweeper = None
+        if session_config.get('sweep_interval'):
+            self.session_sweeper = SessionSweeper(self.active_sessions, session_config['sweep_interval'])
+            self.session_sweeper.start()
+        # 同一用户的消息串行处理（API 层会并发调用），同步与异步路径共用
+        self._session_locks = SessionLocks()
     
     def process_message(self, user_id: str, message: str, channel: str = "wecom") -> str:
         """
@@ -43,6 +84,83 @@ class DialogueCoachAgent:
         Returns:
             Agent 回复
         """
+        with self._session_locks.hold(user_id):
+            return self._dispatch(user_id, message)
+    
+    def needs_llm(self, message: str) -> bool:
+        """消息是否需要等待 LLM（配置了 LLM 且为对话回复），其余消息只做同步处理"""
+        return self.llm is not None and self._recognize_intent(message) == "continue_dialogue"
+    
+    async def aprocess_message(self, user_id: str, message: str, channel: str = "wecom") -> str:
+        """
+        处理用户消息（异步版本），等待 LLM 时不占用线程，
+        会话读写、评估等同步步骤在线程中执行，不阻塞事件循环
+        
+        Args:
+            user_id: 用户唯一标识
+            message: 用户发送的消息
+            channel: 通信渠道
+            
+        Returns:
+            Agent 回复
+        """
+        async with self._session_locks.ahold(user_id):
+            return await self._adispatch(user_id, message)
+    
+    async def _adispatch(self, user_id: str, message: str) -> str:
+        """按意图路由消息（异步版本）"""
+        intent = self._recognize_intent(message)
+        
+        if intent == "continue_dialogue":
+            return await self._ahandle_continue_dialogue(user_id, message)
+        
+        # 其余分支不涉及 LLM 调用
+        return await asyncio.to_thread(self._dispatch, user_id, message)
+    
+    async def astream_message(self, user_id: str, message: str,
+                              channel: str = "wecom") -> AsyncIterator[Tuple[str, str]]:
+        """
+        流式处理用户消息
+        
+        Yields:
+            (事件类型, 内容)：
+            - token: 患者回应的增量文本
+            - prompt: 患者回应结束后的操作提示
+            - section: 评估报告的一个段落
+            - message: 非流式的完整回复（开始训练、帮助等）
+        """
+        # 推送期间一直持有用户锁：同一用户的其他请求（含执行池中的开始训练）等待本轮写回后再读会话
+        async with self._session_locks.ahold(user_id):
+            if self._recognize_intent(message) != "continue_dialogue":
+                yield "message", await asyncio.to_thread(self._dispatch, user_id, message)
+                return
+            
+            session, ended = await asyncio.to_thread(self._begin_turn, user_id, message)
+            if not session:
+                yield "message", NO_SESSION_HINT
+                return
+            
+            if not ended:
+                tokens = []
+                async for token in self._astream_patient_response(session, message):
+                    tokens.append(token)
+                    yield "token", token
+                patient_response = ''.join(tokens)
+                await asyncio.to_thread(self._append_patient_turn, user_id, session, patient_response)
+                
+                if not self._is_dialogue_end(patient_response):
+                    yield "prompt", REPLY_PROMPT
+                    return
+            
+            evaluation = await asyncio.to_thread(self._close_session, user_id)
+            if evaluation is None:
+                yield "message", "没有找到训练记录"
+                return
+            for section in self._iter_evaluation_report(evaluation):
+                yield "section", section
+    
+    def _dispatch(self, user_id: str, message: str) -> str:
+        """按意图路由消息"""
         # 意图识别
         intent = self._recognize_intent(message)
         
@@ -94,10 +212,32 @@ class DialogueCoachAgent:
         # 如果有，认为是继续对话
         return "continue_dialogue"
     
-    def _handle_start_training(self, user_id: str, message: str) -> str:
-        """处理开始训练请求"""
+    def start_training(self, user_id: str, project: Optional[str] = None, seed: Optional[int] = None,
+                       scenario_id: Optional[str] = None) -> Optional[str]:
+        """
+        开始训练，可指定随机种子或回放场景目录中的场景（A/B 对比、压测）
+        
+        Returns:
+            开场回复，scenario_id 未收录时为 None
+        """
+        scenario = self.scenario_tool.replay(scenario_id) if scenario_id else None
+        if scenario_id and scenario is None:
+            return None
+        message = f"我想练习{project}" if project else "我想练习"
+        with self._session_locks.hold(user_id):
+            return self._handle_start_training(user_id, message, seed=seed, scenario=scenario)
+    
+    def _handle_start_training(self, user_id: str, message: str, seed: Optional[int] = None,
+                               scenario: Optional[dict] = None) -> str:
+        """
+        处理开始训练请求
+        
+        Args:
+            seed: 场景随机种子（可选）
+            scenario: 直接使用的场景（回放，可选）
+        """
         # 提取项目/场景
-        project = self._extract_project(message)
+        project = scenario['project'] if scenario else self._extract_project(message)
         
         # 获取用户档案
         user_profile = self._get_user_profile(user_id)
@@ -106,26 +246,53 @@ class DialogueCoachAgent:
         if not project:
             project = user_profile.get('weak_area', '玻尿酸项目介绍')
         
-        # 读取知识库
-        knowledge = self.knowledge_tool.get_project_knowledge(project)
-        
-        # 生成场景
-        scenario = self.scenario_tool.generate(
-            project=project,
-            user_weakness=user_profile.get('weaknesses', []),
-            difficulty=user_profile.get('level', 'medium')
-        )
+        # 读取知识库（按用户所在医院、科室的命名空间）
+        tenant = user_profile.get('tenant', DEFAULT_TENANT)
+        department = user_profile.get('department')
+        knowledge_key = self.knowledge_tool.find_project(project, tenant, department)
+        knowledge = self.knowledge_tool.get_project_knowledge(project, tenant, department)
+        
+        # 生成场景（指定种子时按种子生成，否则启用预生成池时直接取现成场景）
+        weaknesses = user_profile.get('weaknesses', [])
+        difficulty = user_profile.get('level', 'medium')
+        if scenario is None and seed is None and self.scenario_pool is not None:
+            personality = self.scenario_tool.choose_personality(weaknesses)
+            scenario = self.scenario_pool.get(project, personality, difficulty)
+            self.scenario_tool.record(scenario)
+        elif scenario is None:
+            scenario = self.scenario_tool.generate(
+                project=project,
+                user_weakness=weaknesses,
+                difficulty=difficulty,
+                seed=seed
+            )
+            # 指定种子时 generate 已登记
+            if seed is None:
+                self.scenario_tool.record(scenario)
         
         # 创建新会话
         session_id = f"{user_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        self.active_sessions[user_id] = {
+        session = {
             'session_id': session_id,
             'project': project,
             'scenario': scenario,
-            'dialogue_history': [],
+            'scenario_id': scenario['scenario_id'],
+            'history': self.history_manager.new_history(),
             'start_time': datetime.now(),
-            'turn_count': 0
+            'turn_count': 0,
+            # 规则患者的对话状态（expected_flow 阶段序号）
+            'patient_state': 0,
+            # 知识库命名空间与项目名（未收录时为空），用于按项目检索手册片段
+            'knowledge_tenant': tenant,
+            'knowledge_department': knowledge_key[0] if knowledge_key else '',
+            'knowledge_project': knowledge.name if knowledge_key else '',
+            # 增量评估状态，每轮更新，结束时直接出分
+            'evaluation_state': self.evaluation_tool.new_state(self.config['sensitive_words'])
         }
+        session['references'] = self._retrieve_references(
+            session, f"{scenario['patient']['concern']} {' '.join(scenario['patient']['questions'])}", top_k=3
+        )
+        self.active_sessions.put(user_id, session)
         
         # 构建开场白
         response = f"""好的！为你准备【{project}】训练场景
@@ -133,8 +300,9 @@ class DialogueCoachAgent:
 👤 患者角色：
 姓名：{scenario['patient']['name']}
 年龄：{scenario['patient']['age']}岁
-{type_text(scenario['patient']['type'])}：{scenario['patient']['concern']}
+{type_text(scenario['patient'].get('type', 'new'))}：{scenario['patient']['concern']}
 性格：{scenario['patient']['personality']}
+场景编号：{scenario['scenario_id']}
 
 💬 患者说：
 "{scenario['opening']}"
@@ -145,64 +313,164 @@ class DialogueCoachAgent:
     
     def _handle_continue_dialogue(self, user_id: str, message: str) -> str:
         """处理对话继续"""
-        session = self.active_sessions.get(user_id)
+        session, ended = self._begin_turn(user_id, message)
         
         if not session:
             # 没有活跃会话，引导开始训练
-            return "请先告诉我你想练习什么项目？比如：\n• 我想练习玻尿酸\n• 练习超声炮\n• 练习种植牙"
-        
-        # 记录用户回复
-        session['dialogue_history'].append({
-            'role': 'consultant',
-            'content': message,
-            'timestamp': datetime.now().isoformat()
-        })
-        session['turn_count'] += 1
+            return NO_SESSION_HINT
         
-        # 检查是否结束（用户主动结束或达到最大轮数）
-        if message in ['结束', 'finish', 'done'] or session['turn_count'] >= 8:
+        if ended:
             return self._handle_end_dialogue(user_id)
         
         # AI 患者回应
         patient_response = self._generate_patient_response(session, message)
-        session['dialogue_history'].append({
-            'role': 'patient',
-            'content': patient_response,
-            'timestamp': datetime.now().isoformat()
-        })
+        return self._finish_patient_turn(user_id, session, patient_response)
+    
+    async def _ahandle_continue_dialogue(self, user_id: str, message: str) -> str:
+        """处理对话继续（异步版本，只有等待 LLM 在事件循环中进行）"""
+        session, ended = await asyncio.to_thread(self._begin_turn, user_id, message)
+        
+        if not session:
+            return NO_SESSION_HINT
+        
+        if ended:
+            return await asyncio.to_thread(self._handle_end_dialogue, user_id)
+        
+        patient_response = await self._agenerate_patient_response(session, message)
+        return await asyncio.to_thread(self._finish_patient_turn, user_id, session, patient_response)
+    
+    def _begin_turn(self, user_id: str, message: str) -> Tuple[Optional[dict], bool]:
+        """
+        读取会话并记录咨询师回复
+        
+        Returns:
+            (会话, 是否应结束对话)，没有活跃会话时为 (None, False)
+        """
+        session = self.active_sessions.get(user_id)
+        if not session:
+            return None, False
+        return session, self._record_consultant_turn(user_id, session, message)
+    
+    def _record_consultant_turn(self, user_id: str, session: dict, message: str) -> bool:
+        """
+        记录咨询师回复
+        
+        Returns:
+            是否应结束对话（用户主动结束或达到最大轮数）
+        """
+        self.history_manager.append(self._history(session), Role.CONSULTANT, message)
+        session['turn_count'] += 1
+        self._update_evaluation_state(session, {'role': 'consultant', 'content': message})
+        self.active_sessions.put(user_id, session)
+        
+        return message in ['结束', 'finish', 'done'] or session['turn_count'] >= self.history_manager.max_turns
+    
+    def _finish_patient_turn(self, user_id: str, session: dict, patient_response: str) -> str:
+        """记录患者回应，并判断是否自然结束"""
+        self._append_patient_turn(user_id, session, patient_response)
         
         # 检查是否自然结束（患者表达意向或拒绝）
         if self._is_dialogue_end(patient_response):
             return self._handle_end_dialogue(user_id)
         
-        return f"患者说：\"{patient_response}\"\n\n你怎么回应？（回复'结束'可查看评估报告）"
+        return f"患者说：\"{patient_response}\"\n\n{REPLY_PROMPT}"
+    
+    def _append_patient_turn(self, user_id: str, session: dict, patient_response: str):
+        """记录患者回应"""
+        self.history_manager.append(self._history(session), Role.PATIENT, patient_response)
+        self._update_evaluation_state(session, {'role': 'patient', 'content': patient_response})
+        self.active_sessions.put(user_id, session)
+    
+    def _history(self, session: dict) -> dict:
+        """会话的对话历史（旧格式的 dialogue_history 在首次访问时转换）"""
+        history = session.get('history')
+        if history is None:
+            history = session['history'] = self.history_manager.from_dialogue(session.pop('dialogue_history', []))
+        return history
+    
+    def history_stats(self, user_id: str) -> Optional[dict]:
+        """当前会话每轮的 token 数与 LLM 窗口占用，无会话时为 None"""
+        session = self.active_sessions.get(user_id)
+        if not session:
+            return None
+        return self.history_manager.stats(self._history(session))
+    
+    def _update_evaluation_state(self, session: dict, turn: dict):
+        """将新一轮对话计入增量评估状态"""
+        state = session.get('evaluation_state')
+        if state is not None:
+            self.evaluation_tool.update_state(state, turn, self.config['sensitive_words'])
+    
+    def _evaluate_session(self, session: dict) -> dict:
+        """评估会话：优先使用增量状态，旧会话（无状态）回退为全量评估"""
+        state = session.get('evaluation_state')
+        dialogue = self.history_manager.expand(self._history(session))
+        if state is None or state['turns'] != len(dialogue):
+            return self.evaluation_tool.evaluate(
+                dialogue_history=dialogue,
+                project=session['project'],
+                sensitive_words=self.config['sensitive_words']
+            )
+        return self.evaluation_tool.evaluate_state(
+            state,
+            project=session['project'],
+            sensitive_words=self.config['sensitive_words'],
+            dialogue_history=dialogue
+        )
     
     def _handle_end_dialogue(self, user_id: str) -> str:
         """处理对话结束，生成评估报告"""
+        evaluation = self._close_session(user_id)
+        if evaluation is None:
+            return "没有找到训练记录"
+        
+        # 构建报告
+        report = self._build_evaluation_report(evaluation)
+        
+        return report
+    
+    def _close_session(self, user_id: str) -> Optional[dict]:
+        """评估、保存并清理会话，返回评估结果"""
         session = self.active_sessions.get(user_id)
         if not session:
-            return "没有找到训练记录"
+            return None
         
         # 评估对话
-        evaluation = self.evaluation_tool.evaluate(
-            dialogue_history=session['dialogue_history'],
-            project=session['project'],
-            sensitive_words=self.config['sensitive_words']
-        )
+        evaluation = self._evaluate_session(session)
+        evaluation['references'] = self._retrieve_references(session, evaluation['suggestion'], top_k=1)
+        
+        # 清理会话（会话已被其他请求更新时不删除、不保存，由调用方重试）
+        self.active_sessions.delete(user_id, session)
         
         # 保存训练记录
         self._save_training_record(user_id, session, evaluation)
         
-        # 清理会话
-        del self.active_sessions[user_id]
-        
-        # 构建报告
-        report = self._build_evaluation_report(evaluation)
-        
-        return report
+        return evaluation
+    
+    def _on_session_evicted(self, user_id: str, session: dict, reason: str):
+        """会话被淘汰（闲置超时或超出容量）时，按配置补做评估并保存"""
+        if not self.evaluate_abandoned:
+            return
+        if not self.history_manager.has_role(self._history(session), Role.CONSULTANT):
+            return
+        
+        evaluation = self._evaluate_session(session)
+        evaluation['abandoned'] = reason
+        self._save_training_record(user_id, session, evaluation)
+        self.abandoned_evaluated += 1
+    
+    def session_stats(self) -> dict:
+        """会话统计（活跃数、淘汰数、补评估数）"""
+        stats = self.active_sessions.stats()
+        stats['abandoned_evaluated'] = self.abandoned_evaluated
+        return stats
     
     def _build_evaluation_report(self, evaluation: dict) -> str:
         """构建评估报告"""
+        return "\n\n".join(self._iter_evaluation_report(evaluation))
+    
+    def _iter_evaluation_report(self, evaluation: dict) -> Iterator[str]:
+        """按段落生成评估报告（流式接口逐段推送）"""
         dimensions = evaluation['dimensions']
         total_score = evaluation['total_score']
         
@@ -216,58 +484,51 @@ class DialogueCoachAgent:
         else:
             grade = "C"
         
-        report = f"""📊 训练完成！
-
-综合得分：{total_score}/100  评级：{grade}
-
-维度分析：
+        yield "📊 训练完成！"
+        
+        yield f"综合得分：{total_score}/100  评级：{grade}"
+        
+        yield f"""维度分析：
 • 专业度：{dimensions['专业度']}/25
 • 共情力：{dimensions['共情力']}/25
 • 转化力：{dimensions['转化力']}/25
-• 合规性：{dimensions['合规性']}/25
-
-✨ 亮点：
-{chr(10).join(['• ' + p for p in evaluation['highlights'][:3]])}
-
-⚠️ 改进点：
-{chr(10).join(['• ' + i for i in evaluation['improvements'][:3]])}
-
-💡 更好的说法：
-\"{evaluation['suggestion']}\"
-
-回复"继续"开始新的训练，或回复"报告"查看历史成绩"""
+• 合规性：{dimensions['合规性']}/25"""
         
-        return report
+        yield f"""✨ 亮点：
+{chr(10).join(['• ' + p for p in evaluation['highlights'][:3]])}"""
+        
+        yield f"""⚠️ 改进点：
+{chr(10).join(['• ' + i for i in evaluation['improvements'][:3]])}"""
+        
+        yield f"""💡 更好的说法：
+\"{evaluation['suggestion']}\""""
+        
+        if evaluation.get('references'):
+            yield f"""📖 手册参考：
+{chr(10).join(['• ' + r for r in evaluation['references']])}"""
+        
+        yield '回复"继续"开始新的训练，或回复"报告"查看历史成绩'
     
     def _handle_view_report(self, user_id: str) -> str:
         """查看个人报告"""
         profile = self._get_user_profile(user_id)
-        history = self._get_training_history(user_id, days=7)
+        # 读取日汇总，无需遍历每条训练记录
+        rollup = self.training_store.get_rollup('user_id', user_id, days=7)
         
-        if not history:
+        if not rollup['count']:
             return '你还没有训练记录，回复"练习"开始你的第一次训练吧！'
         
-        avg_score = sum(h['score'] for h in history) / len(history)
+        avg_score = rollup['avg_score']
         
         # 找出强项和弱项
-        dimension_scores = {}
-        for h in history:
-            for dim, score in h.get('dimensions', {}).items():
-                if dim not in dimension_scores:
-                    dimension_scores[dim] = []
-                dimension_scores[dim].append(score)
-        
-        avg_dimensions = {
-            dim: sum(scores) / len(scores) 
-            for dim, scores in dimension_scores.items()
-        }
+        avg_dimensions = {dim: stats['avg'] for dim, stats in rollup['dimensions'].items()}
         
         strongest = max(avg_dimensions, key=avg_dimensions.get)
         weakest = min(avg_dimensions, key=avg_dimensions.get)
         
         report = f"""📈 你的训练报告（近7天）
 
-总练习次数：{len(history)}次
+总练习次数：{rollup['count']}次
 平均得分：{avg_score:.1f}分
 
 能力分析：
@@ -341,20 +602,26 @@ class DialogueCoachAgent:
         # 简化实现
         return {
             'user_id': user_id,
+            'tenant': DEFAULT_TENANT,
+            'department': '医美科',
             'level': 'medium',
             'weak_area': '价格谈判',
             'weaknesses': ['价格异议处理', '促成技巧']
         }
     
+    def get_team_stats(self, department: str, days: int = 7) -> dict:
+        """获取科室近 N 天的训练汇总（来自日汇总表）"""
+        return self.training_store.get_rollup('department', department, days=days)
+    
     def _get_training_history(self, user_id: str, days: int = 7) -> List[dict]:
         """获取训练历史"""
-        # 从数据库读取
-        return []
+        return self.training_store.get_user_history(user_id, days=days)
     
     def _save_training_record(self, user_id: str, session: dict, evaluation: dict):
-        """保存训练记录"""
-        # 保存到数据库
-        pass
+        """保存训练记录（写入队列，后台批量落盘）"""
+        department = self._get_user_profile(user_id).get('department', '')
+        dialogue = self.history_manager.expand(self._history(session))
+        self.training_store.save(build_record(user_id, session, evaluation, department, dialogue))
     
     def _is_manager(self, user_id: str) -> bool:
         """检查是否主管"""
@@ -373,11 +640,131 @@ class DialogueCoachAgent:
         }
     
     def _generate_patient_response(self, session: dict, consultant_msg: str) -> str:
-        """生成患者回应"""
-        # 调用 LLM 生成
-        # 简化实现
+        """
+        生成规则患者回应（对话状态机，不调用 LLM）
+        
+        每轮都会推进 session['patient_state']，使用 LLM 时也照常推进，
+        LLM 失败时退回的规则回复与对话进度保持一致
+        """
+        response, session['patient_state'] = self.scenario_tool.respond(
+            session['scenario'], session.get('patient_state', 0), session['turn_count'], consultant_msg
+        )
+        return response
+    
+    async def _agenerate_patient_response(self, session: dict, consultant_msg: str) -> str:
+        """生成患者回应（异步版本，LLM 失败或未配置时退回规则回复）"""
+        fallback = self._generate_patient_response(session, consultant_msg)
+        if self.responder is None:
+            return fallback
+        
+        key = self._patient_cache_key(session)
+        cached = await self.response_cache.aget(key) if key else None
+        if cached is not None:
+            return cached
+        
+        messages = await asyncio.to_thread(self._build_patient_messages, session)
+        response, from_llm = await self.responder.generate(messages, fallback)
+        if key and from_llm:
+            self.response_cache.put(key, response)
+        return response
+    
+    async def _astream_patient_response(self, session: dict, consultant_msg: str) -> AsyncIterator[str]:
+        """流式生成患者回应，LLM 首字超时或在输出前失败时退回规则回复"""
+        fallback = self._generate_patient_response(session, consultant_msg)
+        if self.responder is None:
+            yield fallback
+            return
+        
+        key = self._patient_cache_key(session)
+        cached = await self.response_cache.aget(key) if key else None
+        if cached is not None:
+            yield cached
+            return
+        
+        on_complete = (lambda text: self.response_cache.put(key, text)) if key else None
+        messages = await asyncio.to_thread(self._build_patient_messages, session)
+        async for token in self.responder.stream(messages, fallback, on_complete):
+            yield token
+    
+    def _patient_cache_key(self, session: dict) -> Optional[str]:
+        """患者回复的缓存键：模型 + 场景 + 知识库项目 + 归一化后的对话（含咨询师最新回复）"""
+        if self.response_cache is None:
+            return None
         scenario = session['scenario']
-        return "那大概要多少钱？效果能维持多久？"
+        return cache_key(
+            'patient', self.llm.model, str(self.llm.temperature),
+            scenario.get('scenario_id') or scenario_id(scenario),
+            session.get('knowledge_project', ''),
+            *(f"{role}:{normalize(content)}" for role, content in self.history_manager.iter_dialogue(self._history(session)))
+        )
+    
+    def _patient_prompt_prefix(self, session: dict) -> str:
+        """
+        会话固定的系统提示（角色设定 + 场景相关手册片段），
+        首次构建后保存在会话中，之后每轮直接复用
+        """
+        prefix = session.get('prompt_prefix')
+        if prefix is None:
+            scenario = session['scenario']
+            patient = scenario['patient']
+            prefix = (
+                f"你在扮演一位来医院咨询【{session['project']}】的患者，和咨询师进行对话练习。\n"
+                f"{scenario['context']}\n"
+                f"性格特点：{'、'.join(patient['traits'])}\n"
+                f"可能关心的问题：{'、'.join(patient['questions'])}\n"
+                f"可能提出的异议：{'、'.join(patient['objections'])}\n"
+                "请只以患者身份用一两句口语化的中文回复，不要替咨询师说话。"
+            )
+            if session.get('references'):
+                prefix += "\n以下是医院资料片段，可据此追问细节：\n" + "\n".join(
+                    f"- {r}" for r in session['references']
+                )
+            session['prompt_prefix'] = prefix
+        return prefix
+    
+    def _build_patient_messages(self, session: dict) -> List[dict]:
+        """构建患者角色扮演的 LLM 消息（咨询师为 user，患者为 assistant）"""
+        scenario = session['scenario']
+        system_prompt = self._patient_prompt_prefix(session)
+        
+        # 场景相关片段已在前缀中，这里补充与咨询师最新回复相关的片段，让追问贴合本院资料
+        references = session.get('references', [])
+        history = self._history(session)
+        last = self.history_manager.last(history)
+        if last is not None and last[ROLE] == Role.CONSULTANT:
+            extra = [
+                text for text in self._retrieve_references(session, last[CONTENT])
+                if text not in references
+            ]
+            if extra:
+                if not references:
+                    system_prompt += "\n以下是医院资料片段，可据此追问细节："
+                system_prompt += "\n" + "\n".join(f"- {r}" for r in extra)
+        
+        # 只发送预算内的最近几轮，更早的轮次以摘要代替
+        summary, window = self.history_manager.window(history)
+        if summary:
+            system_prompt += "\n此前的对话摘要：\n" + summary
+        
+        messages = [{'role': 'system', 'content': system_prompt}]
+        # 开场白只在对话开头补上；已有轮次折叠后由摘要承接，窗口直接从咨询师轮次开始
+        if not self.history_manager.folded(history) and (not window or window[0][ROLE] == Role.CONSULTANT):
+            messages.append({'role': 'assistant', 'content': scenario['opening']})
+        for turn in window:
+            role = 'user' if turn[ROLE] == Role.CONSULTANT else 'assistant'
+            messages.append({'role': role, 'content': turn[CONTENT]})
+        return messages
+    
+    def _retrieve_references(self, session: dict, query: str, top_k: int = 2) -> List[str]:
+        """检索会话项目下与查询相关的手册片段"""
+        project = session.get('knowledge_project')
+        if not project:
+            return []
+        return [r['text'] for r in self.knowledge_tool.retrieve(
+            query, top_k=top_k, project=project,
+            tenant=session.get('knowledge_tenant', DEFAULT_TENANT),
+            department=session.get('knowledge_department')
+        )]
     
     def _is_dialogue_end(self, patient_response: str) -> bool:
         """判断对话是否自然结束"""
@@ -385,6 +772,11 @@ class DialogueCoachAgent:
         return any(s in patient_response for s in end_signals)
 
 
+REPLY_PROMPT = "你怎么回应？（回复'结束'可查看评估报告）"
+
+NO_SESSION_HINT = "请先告诉我你想练习什么项目？比如：\n• 我想练习玻尿酸\n• 练习超声炮\n• 练习种植牙"
+
+
 def type_text(patient_type: str) -> str:
     """患者类型文本"""
     type_map = {
@@ -0,0 +1,148 @@
+"""
+对话历史 - 会话内对话记录的紧凑表示、token 预算与滚动摘要
+
+每轮存为 [角色, 内容, 时间戳(秒), token 数]（纯列表，可直接 JSON 序列化进会话存储）；
+送给 LLM 的只有预算内的最近若干轮，更早的轮次折叠成滚动摘要
+"""
+
+import re
+import sys
+import time
+from datetime import datetime
+from enum import IntEnum
+from typing import Iterator, List, Optional, Tuple
+
+
+class Role(IntEnum):
+    CONSULTANT = 0
+    PATIENT = 1
+
+
+ROLE_NAMES = {Role.CONSULTANT: 'consultant', Role.PATIENT: 'patient'}
+ROLE_LABELS = {Role.CONSULTANT: '咨询师', Role.PATIENT: '患者'}
+
+# 紧凑轮次的字段下标
+ROLE, CONTENT, TIMESTAMP, TOKENS = range(4)
+
+_CJK = re.compile(r'[一-鿿　-〿＀-￯]')
+_WORD = re.compile(r'[A-Za-z0-9]+')
+_CLAUSE_END = re.compile(r'[。！？!?；;\n]')
+
+
+def count_tokens(text: str) -> int:
+    """token 数估算：汉字和全角标点各计 1，英文数字每 4 个字符计 1"""
+    return len(_CJK.findall(text)) + sum((len(w) + 3) // 4 for w in _WORD.findall(text))
+
+
+def _first_clause(text: str, max_chars: int) -> str:
+    """取第一个分句，超长截断"""
+    clause = next((c.strip() for c in _CLAUSE_END.split(text) if c.strip()), '')
+    return clause if len(clause) <= max_chars else clause[:max_chars] + '…'
+
+
+class HistoryManager:
+    """
+    对话历史管理
+
+    history 为普通字典（与 evaluation_state 一样随会话保存）：
+    turns 为全部紧凑轮次（评估、保存记录使用），start 之后为 LLM 窗口，
+    之前的轮次已折叠进 summary；窗口 token 数超出 token_budget 时继续折叠，
+    但至少保留 min_recent_turns 轮
+    """
+
+    def __init__(self, config: Optional[dict] = None):
+        config = config or {}
+        self.max_turns = config.get('max_turns', 8)
+        self.token_budget = config.get('token_budget', 1200)
+        self.min_recent_turns = config.get('min_recent_turns', 4)
+        self.summary_tokens = config.get('summary_tokens', 200)
+        self.summary_clause_chars = config.get('summary_clause_chars', 24)
+
+    def new_history(self) -> dict:
+        return {'turns': [], 'start': 0, 'window_tokens': 0, 'summary': '', 'summary_tokens': 0}
+
+    def from_dialogue(self, dialogue: List[dict]) -> dict:
+        """由旧格式的对话记录（[{'role', 'content', 'timestamp'}]）转换"""
+        history = self.new_history()
+        for d in dialogue:
+            role = Role.CONSULTANT if d['role'] == 'consultant' else Role.PATIENT
+            timestamp = d.get('timestamp')
+            self.append(history, role, d['content'],
+                        datetime.fromisoformat(timestamp).timestamp() if timestamp else None)
+        return history
+
+    def append(self, history: dict, role: Role, content: str, timestamp: Optional[float] = None) -> int:
+        """追加一轮，返回该轮 token 数"""
+        tokens = count_tokens(content)
+        history['turns'].append([int(role), sys.intern(content), int(timestamp or time.time()), tokens])
+        history['window_tokens'] += tokens
+        self._compact(history)
+        return tokens
+
+    def _compact(self, history: dict):
+        """窗口超出预算时把最早的轮次折叠进摘要；窗口以咨询师轮次开头，保证消息角色交替"""
+        turns = history['turns']
+        folded = False
+        while len(turns) - history['start'] > self.min_recent_turns and (
+                history['window_tokens'] > self.token_budget
+                or (folded and turns[history['start']][ROLE] == Role.PATIENT)):
+            turn = turns[history['start']]
+            history['start'] += 1
+            history['window_tokens'] -= turn[TOKENS]
+            history['summary'] = self._fold(history['summary'], turn)
+            folded = True
+        if folded:
+            history['summary_tokens'] = count_tokens(history['summary'])
+
+    def _fold(self, summary: str, turn: list) -> str:
+        """把一轮并入摘要（每轮保留首个分句），超出摘要预算时丢弃最早的行"""
+        lines = summary.split('\n') if summary else []
+        lines.append(f"{ROLE_LABELS[Role(turn[ROLE])]}：{_first_clause(turn[CONTENT], self.summary_clause_chars)}")
+        while len(lines) > 1 and count_tokens('\n'.join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        return '\n'.join(lines)
+
+    def window(self, history: dict) -> Tuple[str, List[list]]:
+        """(滚动摘要, 窗口内的轮次)"""
+        return history['summary'], history['turns'][history['start']:]
+
+    def folded(self, history: dict) -> bool:
+        """是否已有轮次折叠进摘要"""
+        return history['start'] > 0
+
+    def last(self, history: dict) -> Optional[list]:
+        return history['turns'][-1] if history['turns'] else None
+
+    def has_role(self, history: dict, role: Role) -> bool:
+        return any(turn[ROLE] == role for turn in history['turns'])
+
+    def iter_dialogue(self, history: dict) -> Iterator[Tuple[str, str]]:
+        """全部轮次的 (角色名, 内容)"""
+        for turn in history['turns']:
+            yield ROLE_NAMES[Role(turn[ROLE])], turn[CONTENT]
+
+    def expand(self, history: dict) -> List[dict]:
+        """展开为 [{'role', 'content', 'timestamp'}]（评估、训练记录使用的格式）"""
+        return [
+            {
+                'role': ROLE_NAMES[Role(turn[ROLE])],
+                'content': turn[CONTENT],
+                'timestamp': datetime.fromtimestamp(turn[TIMESTAMP]).isoformat()
+            }
+            for turn in history['turns']
+        ]
+
+    def stats(self, history: dict) -> dict:
+        """每轮 token 数与窗口、摘要占用"""
+        return {
+            'turns': [
+                {'role': ROLE_NAMES[Role(turn[ROLE])], 'tokens': turn[TOKENS], 'in_window': i >= history['start']}
+                for i, turn in enumerate(history['turns'])
+            ],
+            'total_tokens': sum(turn[TOKENS] for turn in history['turns']),
+            'window_start': history['start'],
+            'window_tokens': history['window_tokens'],
+            'summary_tokens': history['summary_tokens'],
+            'prompt_tokens': history['window_tokens'] + history['summary_tokens'],
+            'token_budget': self.token_budget
+        }
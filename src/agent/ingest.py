@@ -0,0 +1,95 @@
+"""
+知识库导入 - 上传文件的异步解析任务队列
+"""
+
+import queue
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from .jobs import JobStore
+from .tools.knowledge import KnowledgeTool
+
+
+class IngestJob:
+    """单个文件的导入任务"""
+
+    def __init__(self, file_path: Path, filename: str, size: int):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.file_path = file_path
+        self.filename = filename
+        self.size = size
+        self.status = 'pending'
+        self.error = ''
+        self.elapsed = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def run(self, tool: KnowledgeTool, jobs: JobStore):
+        self.status = 'running'
+        self.started_at = time.time()
+        jobs.update(self.to_dict())
+        try:
+            report = tool.ingest(self.file_path)
+            rel_path = self.file_path.relative_to(tool.knowledge_path).as_posix()
+            self.elapsed = report['timings'].get(rel_path)
+            if rel_path in report['failures']:
+                self.status = 'failed'
+                self.error = report['failures'][rel_path]
+            else:
+                self.status = 'completed'
+        except Exception as e:
+            self.status = 'failed'
+            self.error = str(e)
+        self.finished_at = time.time()
+        jobs.update(self.to_dict())
+
+    def to_dict(self) -> dict:
+        return {
+            'job_id': self.job_id,
+            'filename': self.filename,
+            'size': self.size,
+            'status': self.status,
+            'error': self.error,
+            'parse_seconds': self.elapsed,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+class IngestQueue(threading.Thread):
+    """
+    导入任务队列（单个后台线程顺序处理）
+
+    每个任务只解析上传的那一个文件；解析本身在知识库的进程池中进行，
+    上传请求写完文件即返回，不等待解析；任务状态记在共享的任务表中，任一 worker 都能查询
+    """
+
+    def __init__(self, tool: KnowledgeTool, jobs: JobStore):
+        super().__init__(name='knowledge-ingest', daemon=True)
+        self.tool = tool
+        self.jobs = jobs
+        self._queue: queue.Queue = queue.Queue()
+
+    def submit(self, file_path: Path, filename: str, size: int) -> IngestJob:
+        job = IngestJob(file_path, filename, size)
+        self.jobs.create('ingest', job.to_dict())
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.jobs.get(job_id, 'ingest')
+
+    def run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            job.run(self.tool, self.jobs)
+
+    def stop(self):
+        self._queue.put(None)
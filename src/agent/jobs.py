@@ -0,0 +1,160 @@
+"""
+后台任务状态 - SQLite 持久化，多个 worker 共享（任一 worker 都能查询任务进度）
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Set
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_kind_created ON jobs (kind, created_at);
+"""
+
+# 未结束的任务状态
+ACTIVE_STATUSES = ('pending', 'running')
+
+
+class JobStore:
+    """
+    后台任务状态（知识库导入、重评分）
+
+    任务由接收请求的 worker 执行，状态变化时写入共享的 SQLite；
+    本进程登记的未结束任务（排队、运行中）由心跳线程每 heartbeat_interval 秒刷新更新时间，
+    超过 stale_after 秒没有更新，视为执行它的进程已退出
+    """
+
+    def __init__(self, config: Optional[dict] = None):
+        config = config or {}
+        self.path = Path(config.get('path', './data/jobs.db'))
+        self.max_jobs = config.get('max_jobs', 200)
+        self.stale_after = config.get('stale_after', 600)
+        self.heartbeat_interval = config.get('heartbeat_interval', 30)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+        # 本进程登记、尚未结束的任务
+        self._owned: Set[str] = set()
+        self._owned_lock = threading.Lock()
+        self._heartbeat = JobHeartbeat(self, self.heartbeat_interval)
+        self._heartbeat.start()
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程一个连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def create(self, kind: str, job: dict, exclusive: bool = False) -> bool:
+        """
+        登记新任务
+
+        Args:
+            kind: 任务类型（ingest / rescore）
+            job: 任务状态（含 job_id、status）
+            exclusive: 同类型已有未结束的任务时不登记（检查与写入在同一写事务内，多个 worker 间互斥）
+
+        Returns:
+            是否登记成功
+        """
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if exclusive and conn.execute(
+                f"SELECT 1 FROM jobs WHERE kind = ? AND status IN {ACTIVE_STATUSES} AND updated_at >= ? LIMIT 1",
+                (kind, now - self.stale_after)
+            ).fetchone():
+                return False
+            conn.execute(
+                "INSERT INTO jobs (job_id, kind, status, data, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job['job_id'], kind, job['status'], json.dumps(job, ensure_ascii=False), now, now)
+            )
+            # 每类只保留最近 max_jobs 个任务（仍在执行的除外）
+            conn.execute(
+                f"DELETE FROM jobs WHERE kind = ? AND (status NOT IN {ACTIVE_STATUSES} OR updated_at < ?) "
+                "AND job_id NOT IN (SELECT job_id FROM jobs WHERE kind = ? ORDER BY created_at DESC LIMIT ?)",
+                (kind, now - self.stale_after, kind, self.max_jobs)
+            )
+        if job['status'] in ACTIVE_STATUSES:
+            with self._owned_lock:
+                self._owned.add(job['job_id'])
+        return True
+
+    def update(self, job: dict):
+        """写入任务的最新状态"""
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, data = ?, updated_at = ? WHERE job_id = ?",
+                (job['status'], json.dumps(job, ensure_ascii=False), time.time(), job['job_id'])
+            )
+        if job['status'] not in ACTIVE_STATUSES:
+            with self._owned_lock:
+                self._owned.discard(job['job_id'])
+
+    def touch(self):
+        """刷新本进程未结束任务的更新时间（心跳）"""
+        with self._owned_lock:
+            owned = list(self._owned)
+        if not owned:
+            return
+        with self._conn() as conn:
+            conn.executemany(
+                f"UPDATE jobs SET updated_at = ? WHERE job_id = ? AND status IN {ACTIVE_STATUSES}",
+                [(time.time(), job_id) for job_id in owned]
+            )
+
+    def close(self):
+        """停止心跳线程"""
+        self._heartbeat.stop()
+
+    def get(self, job_id: str, kind: str) -> Optional[dict]:
+        """查询任务状态，不存在时返回 None"""
+        row = self._conn().execute(
+            "SELECT data, status, updated_at FROM jobs WHERE job_id = ? AND kind = ?", (job_id, kind)
+        ).fetchone()
+        if row is None:
+            return None
+        job = json.loads(row['data'])
+        if row['status'] in ACTIVE_STATUSES and row['updated_at'] < time.time() - self.stale_after:
+            job['status'] = 'failed'
+            job['error'] = job.get('error') or '任务已中断（执行任务的进程已退出）'
+        return job
+
+
+class JobHeartbeat(threading.Thread):
+    """心跳线程：任务排队或长时间无进度（如重建日汇总）时，证明执行它的进程仍在运行"""
+
+    def __init__(self, store: JobStore, interval: float):
+        super().__init__(name='job-heartbeat', daemon=True)
+        self.store = store
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.store.touch()
+            except Exception as e:
+                print(f"[Jobs] 心跳写入失败: {e}")
+
+    def stop(self):
+        self._stop_event.set()
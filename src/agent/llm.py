@@ -0,0 +1,270 @@
+"""
+LLM 客户端 - 可插拔的异步模型调用接口
+"""
+
+import asyncio
+import json
+import os
+import random
+from typing import AsyncIterator, Dict, List, Optional
+
+
+class LLMError(Exception):
+    """LLM 调用失败（网络错误、超时、响应异常）"""
+
+
+class LLMProvider:
+    """异步 LLM Provider 基类"""
+
+    def __init__(self, config: dict):
+        self.model = config.get('model', '')
+        self.temperature = config.get('temperature', 0.7)
+        self.max_tokens = config.get('max_tokens', 1024)
+        self.timeout = config.get('timeout', 30)
+
+    async def complete(self, messages: List[Dict[str, str]], timeout: Optional[float] = None) -> str:
+        """
+        生成回复
+
+        Args:
+            messages: 对话消息，[{'role': 'system'|'user'|'assistant', 'content': str}]
+            timeout: 本次请求超时（秒），不指定使用配置值
+
+        Returns:
+            模型回复文本
+
+        Raises:
+            LLMError: 调用失败或超时
+        """
+        try:
+            return await asyncio.wait_for(
+                self._complete(messages),
+                timeout=timeout or self.timeout
+            )
+        except asyncio.TimeoutError:
+            raise LLMError(f"LLM 请求超时（{timeout or self.timeout}s）")
+
+    async def _complete(self, messages: List[Dict[str, str]]) -> str:
+        raise NotImplementedError
+
+    async def stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """
+        流式生成回复，逐段产出增量文本
+
+        默认实现一次性返回完整回复，支持流式的 Provider 覆盖此方法
+
+        Raises:
+            LLMError: 调用失败或超时
+        """
+        yield await self.complete(messages)
+
+    async def aclose(self):
+        """释放连接池"""
+
+
+class FakeLLMProvider(LLMProvider):
+    """本地模拟 Provider，用于测试和压测（模拟网络延迟）"""
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.latency = config.get('latency', 0.5)
+        self.jitter = config.get('jitter', 0.2)
+        self.replies = config.get('replies') or [
+            "那大概要多少钱？效果能维持多久？",
+            "听起来不错，不过会不会很疼？",
+            "我有点担心效果不自然，你们有案例吗？",
+            "价格有点超预算，有没有优惠？"
+        ]
+
+    async def _complete(self, messages: List[Dict[str, str]]) -> str:
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        return self._pick_reply(messages)
+
+    async def stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        # 首字延迟占大头，之后逐字输出
+        await asyncio.sleep(max(0.0, self.latency * 0.5 + random.uniform(-self.jitter, self.jitter) * 0.5))
+        reply = self._pick_reply(messages)
+        per_char = self.latency * 0.5 / max(1, len(reply))
+        for ch in reply:
+            await asyncio.sleep(per_char)
+            yield ch
+
+    def _pick_reply(self, messages: List[Dict[str, str]]) -> str:
+        turn = sum(1 for m in messages if m['role'] == 'user')
+        return self.replies[turn % len(self.replies)]
+
+
+class HTTPLLMProvider(LLMProvider):
+    """基于 httpx 连接池的 HTTP Provider 基类"""
+
+    default_base_url = ''
+    api_key_env = ''
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.base_url = (config.get('base_url') or self.default_base_url).rstrip('/')
+        self.api_key = config.get('api_key') or os.environ.get(self.api_key_env, '')
+        self.max_connections = config.get('max_connections', 100)
+        self.max_keepalive = config.get('max_keepalive', 20)
+        self._client = None
+
+    def _get_client(self):
+        """延迟创建连接池（需在事件循环中创建）"""
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=min(5.0, self.timeout)),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive
+                )
+            )
+        return self._client
+
+    async def _post(self, path: str, payload: dict, headers: dict) -> dict:
+        import httpx
+        try:
+            response = await self._get_client().post(path, json=payload, headers=headers)
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPError as e:
+            raise LLMError(f"LLM 请求失败: {e}")
+
+    async def _stream_events(self, path: str, payload: dict, headers: dict) -> AsyncIterator[dict]:
+        """发起流式请求，逐条产出 SSE data 事件"""
+        import httpx
+        try:
+            async with self._get_client().stream('POST', path, json=payload, headers=headers) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith('data:'):
+                        continue
+                    data = line[5:].strip()
+                    if data == '[DONE]':
+                        return
+                    try:
+                        yield json.loads(data)
+                    except ValueError:
+                        continue
+        except httpx.HTTPError as e:
+            raise LLMError(f"LLM 请求失败: {e}")
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class OpenAIProvider(HTTPLLMProvider):
+    """OpenAI 兼容接口（含本地部署的兼容服务）"""
+
+    default_base_url = 'https://api.openai.com/v1'
+    api_key_env = 'OPENAI_API_KEY'
+
+    def _payload(self, messages: List[Dict[str, str]], stream: bool = False) -> dict:
+        return {
+            'model': self.model,
+            'messages': messages,
+            'temperature': self.temperature,
+            'max_tokens': self.max_tokens,
+            'stream': stream
+        }
+
+    def _headers(self) -> dict:
+        return {'Authorization': f'Bearer {self.api_key}'}
+
+    async def _complete(self, messages: List[Dict[str, str]]) -> str:
+        data = await self._post('/chat/completions', self._payload(messages), self._headers())
+        try:
+            return data['choices'][0]['message']['content'].strip()
+        except (KeyError, IndexError, TypeError):
+            raise LLMError("LLM 响应格式异常")
+
+    async def stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        events = self._stream_events('/chat/completions', self._payload(messages, stream=True), self._headers())
+        async for event in events:
+            try:
+                token = event['choices'][0]['delta'].get('content')
+            except (KeyError, IndexError, TypeError):
+                continue
+            if token:
+                yield token
+
+
+class AnthropicProvider(HTTPLLMProvider):
+    """Anthropic Messages 接口"""
+
+    default_base_url = 'https://api.anthropic.com/v1'
+    api_key_env = 'ANTHROPIC_API_KEY'
+
+    def _payload(self, messages: List[Dict[str, str]], stream: bool = False) -> dict:
+        system = '\n'.join(m['content'] for m in messages if m['role'] == 'system')
+        turns = [m for m in messages if m['role'] != 'system']
+        # Messages 接口要求首条消息为 user
+        if turns and turns[0]['role'] != 'user':
+            turns.insert(0, {'role': 'user', 'content': '你好'})
+        return {
+            'model': self.model,
+            'system': system,
+            'messages': turns,
+            'temperature': self.temperature,
+            'max_tokens': self.max_tokens,
+            'stream': stream
+        }
+
+    def _headers(self) -> dict:
+        return {'x-api-key': self.api_key, 'anthropic-version': '2023-06-01'}
+
+    async def stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        events = self._stream_events('/messages', self._payload(messages, stream=True), self._headers())
+        async for event in events:
+            if event.get('type') == 'content_block_delta':
+                token = event.get('delta', {}).get('text')
+                if token:
+                    yield token
+
+    async def _complete(self, messages: List[Dict[str, str]]) -> str:
+        data = await self._post('/messages', self._payload(messages), self._headers())
+        try:
+            return ''.join(b.get('text', '') for b in data['content']).strip()
+        except (KeyError, TypeError):
+            raise LLMError("LLM 响应格式异常")
+
+
+PROVIDERS = {
+    'openai': OpenAIProvider,
+    'local': OpenAIProvider,
+    'anthropic': AnthropicProvider,
+    'fake': FakeLLMProvider
+}
+
+
+def create_llm_provider(config: Optional[dict]) -> Optional[LLMProvider]:
+    """
+    根据配置创建 Provider
+
+    Returns:
+        Provider 实例；未配置、缺少 API Key 或缺少 httpx 时返回 None（使用规则回复）
+    """
+    if not config:
+        return None
+
+    provider_cls = PROVIDERS.get(config.get('provider', ''))
+    if provider_cls is None:
+        print(f"[LLM] 未知 provider: {config.get('provider')}")
+        return None
+
+    if issubclass(provider_cls, HTTPLLMProvider):
+        try:
+            import httpx  # noqa: F401
+        except ImportError:
+            print("[LLM] 需要安装 httpx，使用规则回复")
+            return None
+
+    provider = provider_cls(config)
+    if isinstance(provider, HTTPLLMProvider) and config.get('provider') != 'local' and not provider.api_key:
+        print(f"[LLM] 未配置 {provider.api_key_env}，使用规则回复")
+        return None
+
+    return provider
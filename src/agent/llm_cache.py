@@ -0,0 +1,202 @@
+"""
+LLM 回复缓存 - 相同场景、相同对话前缀、相同（归一化后）咨询师回复直接复用模型回复
+
+内存层为 LRU + TTL，可选 SQLite 磁盘层（多个 worker 共享、重启不丢失）
+"""
+
+import asyncio
+import hashlib
+import logging
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+_SPACES = re.compile(r'\s+')
+_REPEATED_PUNCT = re.compile(r'([，。！？,.!?~～…])\1+')
+_TRAILING_PUNCT = re.compile(r'[。！!~～…\s]+$')
+
+_STOP = object()
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(text: str) -> str:
+    """归一化文本：合并空白、转小写、压缩重复标点、去掉句末语气标点（保留问号）"""
+    text = _SPACES.sub(' ', text).strip().lower()
+    text = _REPEATED_PUNCT.sub(r'\1', text)
+    return _TRAILING_PUNCT.sub('', text)
+
+
+def cache_key(*parts: str) -> str:
+    """由若干字段生成缓存键"""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    回复缓存
+
+    内存层按最近使用淘汰，条目过期后视为未命中；
+    配置 disk_path 时写入由后台线程批量落盘，内存未命中再查磁盘并回填内存
+    （异步路径用 aget，磁盘查询不在事件循环中执行）
+    """
+
+    def __init__(self, config: dict):
+        self.max_entries = config.get('max_entries', 5000)
+        self.ttl = config.get('ttl', 86400)
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = {'memory': 0, 'disk': 0}
+        self.misses = 0
+        self.puts = 0
+
+        self.disk_path = Path(config['disk_path']) if config.get('disk_path') else None
+        self._local = threading.local()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._writer = None
+        if self.disk_path is not None:
+            self.disk_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = self._conn()
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+            conn.commit()
+            self._writer = threading.Thread(target=self._write_loop, name='llm-cache-writer', daemon=True)
+            self._writer.start()
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程一个连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.disk_path), timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._get_memory(key)
+        if value is None and self.disk_path is not None:
+            value = self._get_disk(key)
+        if value is None:
+            self._miss()
+        return value
+
+    async def aget(self, key: str) -> Optional[str]:
+        """异步读取：内存层直接返回，磁盘层在线程中查询"""
+        value = self._get_memory(key)
+        if value is None and self.disk_path is not None:
+            value = await asyncio.to_thread(self._get_disk, key)
+        if value is None:
+            self._miss()
+        return value
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > time.time():
+                    self._memory.move_to_end(key)
+                    self.hits['memory'] += 1
+                    return entry[1]
+                del self._memory[key]
+        return None
+
+    def _get_disk(self, key: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM responses WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        with self._lock:
+            self._store(key, row[0], row[1])
+            self.hits['disk'] += 1
+        return row[0]
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def put(self, key: str, value: str):
+        """写入内存层，磁盘层交给写线程（不阻塞调用方）"""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, value, expires_at)
+            self.puts += 1
+        if self._writer is not None:
+            self._queue.put((key, value, expires_at))
+
+    def close(self):
+        """写入剩余条目并停止写线程"""
+        if self._writer is not None:
+            self._queue.put(_STOP)
+            self._writer.join(timeout=10)
+
+    def _write_loop(self):
+        conn = self._conn()
+        while True:
+            item = self._queue.get()
+            batch, stop = [], False
+            while True:
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                if batch:
+                    with conn:
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)", batch
+                        )
+            except Exception:
+                # 磁盘层只是缓存，写入失败时条目仍在内存层
+                logger.exception("LLM 回复缓存落盘失败，丢弃 %d 条", len(batch))
+            if stop:
+                return
+
+    def _store(self, key: str, value: str, expires_at: float):
+        """写入内存层（调用方持有锁）"""
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = sum(self.hits.values())
+            requests = hits + self.misses
+            return {
+                'entries': len(self._memory),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'disk': str(self.disk_path) if self.disk_path else None,
+                'hits': dict(self.hits),
+                'misses': self.misses,
+                'hit_rate': round(hits / requests, 4) if requests else None,
+                'puts': self.puts
+            }
+
+
+def create_response_cache(config: Optional[dict]) -> Optional[ResponseCache]:
+    """按配置创建缓存，未配置或 max_entries 为 0 时返回 None"""
+    if not config or not config.get('max_entries', 5000):
+        return None
+    return ResponseCache(config)
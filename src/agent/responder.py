@@ -0,0 +1,181 @@
+"""
+患者回应调度 - LLM 与规则回复混合，按每轮延迟预算兜底，连续失败时熔断
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from .llm import LLMError, LLMProvider
+
+
+class CircuitBreaker:
+    """
+    熔断器（只在事件循环中使用）
+
+    连续失败 failure_threshold 次后断开 cooldown 秒，期间直接走规则回复；
+    冷却结束后放行一次试探请求，成功则恢复，失败则重新断开
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probe_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == 'closed':
+            return True
+        if self.state == 'open' and time.monotonic() - self._opened_at >= self.cooldown:
+            self.state = 'half_open'
+            self._probing = False
+        # 试探请求被取消时不会回报结果，超过冷却时间再放行一次
+        if self.state == 'half_open' and (not self._probing or time.monotonic() - self._probe_at >= self.cooldown):
+            self._probing = True
+            self._probe_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self):
+        self.state = 'closed'
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            if self.state != 'open':
+                self.opened += 1
+            self.state = 'open'
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class HybridResponder:
+    """
+    患者回应：优先 LLM，超出延迟预算、调用失败或熔断时使用规则回复
+
+    调用方先算好规则回复（对话状态机，微秒级）作为兜底，
+    因此单轮耗时不超过 latency_budget（流式为首字不超过 first_token_budget）
+    """
+
+    def __init__(self, llm: LLMProvider, config: Optional[dict] = None):
+        config = config or {}
+        self.llm = llm
+        self.latency_budget = config.get('latency_budget', 3.0)
+        self.first_token_budget = config.get('first_token_budget', self.latency_budget)
+        self.breaker = CircuitBreaker(config.get('failure_threshold', 5), config.get('cooldown', 30))
+        self.requests = 0
+        self.llm_replies = 0
+        self.fallbacks: Dict[str, int] = {'timeout': 0, 'error': 0, 'circuit_open': 0}
+        self._latencies = deque(maxlen=config.get('latency_window', 1000))
+
+    async def complete(self, messages: List[Dict[str, str]], fallback: str) -> str:
+        """
+        生成回应
+
+        Args:
+            messages: LLM 消息
+            fallback: 规则回复
+
+        Returns:
+            LLM 回复，或预算内未完成 / 失败 / 熔断时的规则回复
+        """
+        return (await self.generate(messages, fallback))[0]
+
+    async def generate(self, messages: List[Dict[str, str]], fallback: str) -> Tuple[str, bool]:
+        """同 complete，另返回回复是否来自 LLM（规则回复不应写入缓存）"""
+        started = time.perf_counter()
+        self.requests += 1
+        try:
+            if not self.breaker.allow():
+                return self._fallback('circuit_open', fallback), False
+            try:
+                reply = await asyncio.wait_for(self.llm.complete(messages), timeout=self.latency_budget)
+            except asyncio.TimeoutError:
+                self.breaker.record_failure()
+                return self._fallback('timeout', fallback), False
+            except LLMError as e:
+                print(f"[LLM] {e}")
+                self.breaker.record_failure()
+                return self._fallback('error', fallback), False
+            self.breaker.record_success()
+            self.llm_replies += 1
+            return reply, True
+        finally:
+            self._latencies.append(time.perf_counter() - started)
+
+    async def stream(self, messages: List[Dict[str, str]], fallback: str,
+                     on_complete: Optional[Callable[[str], None]] = None) -> AsyncIterator[str]:
+        """
+        流式生成回应：首字超出预算或输出前失败时产出规则回复；
+        已开始输出后失败则在此处截止。LLM 完整输出后以全文调用 on_complete
+        """
+        started = time.perf_counter()
+        self.requests += 1
+        if not self.breaker.allow():
+            self._latencies.append(time.perf_counter() - started)
+            yield self._fallback('circuit_open', fallback)
+            return
+
+        tokens = self.llm.stream(messages)
+        try:
+            first = await asyncio.wait_for(tokens.__anext__(), timeout=self.first_token_budget)
+        except (asyncio.TimeoutError, StopAsyncIteration, LLMError) as e:
+            await tokens.aclose()
+            if isinstance(e, LLMError):
+                print(f"[LLM] {e}")
+            self.breaker.record_failure()
+            self._latencies.append(time.perf_counter() - started)
+            yield self._fallback('timeout' if isinstance(e, asyncio.TimeoutError) else 'error', fallback)
+            return
+
+        self._latencies.append(time.perf_counter() - started)
+        output = [first]
+        yield first
+        try:
+            async for token in tokens:
+                output.append(token)
+                yield token
+        except LLMError as e:
+            print(f"[LLM] {e}")
+            self.breaker.record_failure()
+            return
+        self.breaker.record_success()
+        self.llm_replies += 1
+        if on_complete is not None:
+            on_complete(''.join(output))
+
+    def _fallback(self, reason: str, fallback: str) -> str:
+        self.fallbacks[reason] += 1
+        return fallback
+
+    def stats(self) -> dict:
+        """回退率、熔断状态与延迟分位（流式为首字延迟，单位毫秒）"""
+        latencies = sorted(self._latencies)
+        fallbacks = sum(self.fallbacks.values())
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+        return {
+            'latency_budget': self.latency_budget,
+            'first_token_budget': self.first_token_budget,
+            'requests': self.requests,
+            'llm_replies': self.llm_replies,
+            'fallbacks': dict(self.fallbacks),
+            'fallback_rate': round(fallbacks / self.requests, 4) if self.requests else None,
+            'circuit': {
+                'state': self.breaker.state,
+                'consecutive_failures': self.breaker.failures,
+                'opened': self.breaker.opened
+            },
+            'latency_ms': {'p50': percentile(0.5), 'p95': percentile(0.95), 'p99': percentile(0.99)}
+        }
@@ -0,0 +1,159 @@
+"""
+场景预生成池 - 按 (项目, 性格, 难度) 预先生成训练场景，开始训练时直接取用
+"""
+
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from .tools.scenario import ScenarioTool
+
+# 池的键：(项目, 性格, 难度)
+PoolKey = Tuple[str, str, str]
+
+
+class ScenarioPool(threading.Thread):
+    """
+    场景预生成池（单个后台线程补货）
+
+    每个键保留 size 个现成场景，取走一个即排队异步补齐；
+    未命中时当场生成（与不启用池时相同），并登记该键以便后续命中。
+    键数量超过 max_keys 时淘汰最久未使用的键
+    """
+
+    def __init__(self, tool: ScenarioTool, size: int = 3, max_keys: int = 200):
+        super().__init__(name='scenario-pool', daemon=True)
+        self.tool = tool
+        self.size = size
+        self.max_keys = max_keys
+        self._pools: Dict[PoolKey, Deque[dict]] = OrderedDict()
+        self._pending = set()
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.failures = 0
+        self._miss_seconds = 0.0
+
+    def get(self, project: str, personality: str, difficulty: str) -> dict:
+        """取一个场景，池中没有时当场生成"""
+        key = (project, personality, difficulty)
+        scenario = None
+        with self._lock:
+            pool = self._register(key)
+            if pool:
+                scenario = pool.popleft()
+                self.hits += 1
+            else:
+                self.misses += 1
+        self._schedule(key)
+
+        if scenario is None:
+            started = time.perf_counter()
+            scenario = self._generate(key)
+            with self._lock:
+                self._miss_seconds += time.perf_counter() - started
+        return scenario
+
+    def warm(self, keys: Iterable[PoolKey]):
+        """登记并排队预热一批键（启动时调用）"""
+        for key in keys:
+            with self._lock:
+                self._register(key)
+            self._schedule(key)
+
+    def _register(self, key: PoolKey) -> Deque[dict]:
+        """登记键（调用方持有锁），返回该键的场景队列"""
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = deque()
+            while len(self._pools) > self.max_keys:
+                self._pools.popitem(last=False)
+        else:
+            self._pools.move_to_end(key)
+        return pool
+
+    def _schedule(self, key: PoolKey):
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self._queue.put(key)
+
+    def _generate(self, key: PoolKey) -> dict:
+        project, personality, difficulty = key
+        return self.tool.generate(project, [], difficulty, personality=personality)
+
+    def _refill(self, key: PoolKey):
+        """补齐一个键的场景（生成在锁外进行）"""
+        while True:
+            with self._lock:
+                pool = self._pools.get(key)
+                if pool is None or len(pool) >= self.size:
+                    return
+            scenario = self._generate(key)
+            with self._lock:
+                pool = self._pools.get(key)
+                if pool is None:
+                    return
+                pool.append(scenario)
+                self.generated += 1
+
+    def run(self):
+        while True:
+            key = self._queue.get()
+            if key is None:
+                break
+            try:
+                self._refill(key)
+            except Exception as e:
+                self.failures += 1
+                print(f"[ScenarioPool] 生成场景失败 {key}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+    def stop(self):
+        self._queue.put(None)
+
+    def stats(self) -> dict:
+        """命中率、补货数与各键存量"""
+        with self._lock:
+            requests = self.hits + self.misses
+            ready: List[dict] = [
+                {'project': p, 'personality': t, 'difficulty': d, 'ready': len(pool)}
+                for (p, t, d), pool in self._pools.items()
+            ]
+            return {
+                'size': self.size,
+                'keys': len(self._pools),
+                'max_keys': self.max_keys,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / requests, 4) if requests else None,
+                'avg_miss_ms': round(self._miss_seconds / self.misses * 1000, 3) if self.misses else None,
+                'generated': self.generated,
+                'failures': self.failures,
+                'pending': len(self._pending),
+                'pools': ready
+            }
+
+
+def create_scenario_pool(tool: ScenarioTool, config: Optional[dict]) -> Optional[ScenarioPool]:
+    """按配置创建并启动场景池，size 为 0 或未配置时返回 None"""
+    config = config or {}
+    size = config.get('size', 0)
+    if not size:
+        return None
+    pool = ScenarioPool(tool, size=size, max_keys=config.get('max_keys', 200))
+    pool.start()
+    pool.warm(
+        (project, personality, difficulty)
+        for project in config.get('warm_projects') or []
+        for personality in tool.personalities
+        for difficulty in config.get('warm_difficulties') or ['medium']
+    )
+    return pool
@@ -0,0 +1,404 @@
+"""
+会话存储 - 训练会话的存取抽象，支持内存与 SQLite（WAL）两种实现
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+# 淘汰回调：(user_id, session, reason)，reason 为 'ttl' 或 'capacity'
+EvictCallback = Callable[[str, dict, str], None]
+
+# SQLite 存储读出的会话中记录版本号的键（不写入会话内容）
+VERSION_KEY = '_version'
+
+
+class SessionConflict(Exception):
+    """会话在读取后已被其他请求（其他 worker）更新或结束"""
+
+
+class SessionStore:
+    """会话存储基类"""
+
+    def __init__(self, config: dict):
+        self.ttl = config.get('ttl', 7200)
+        self.max_sessions = config.get('max_sessions', 0)
+        self.on_evict: Optional[EvictCallback] = None
+        self.evictions = {'ttl': 0, 'capacity': 0}
+        self._stats_lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[dict]:
+        """获取会话，不存在或已过期返回 None"""
+        raise NotImplementedError
+
+    def put(self, user_id: str, session: dict):
+        """
+        写入（或更新）会话，并刷新过期时间
+
+        Raises:
+            SessionConflict: 会话读取后已被其他请求更新（支持多 worker 的存储）
+        """
+        raise NotImplementedError
+
+    def delete(self, user_id: str, session: Optional[dict] = None):
+        """
+        删除会话
+
+        Args:
+            session: 读取到的会话（可选），传入时只在会话未被其他请求更新时删除
+
+        Raises:
+            SessionConflict: 会话读取后已被其他请求更新（支持多 worker 的存储）
+        """
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        """清理过期会话，返回清理数量"""
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def __contains__(self, user_id: str) -> bool:
+        return self.get(user_id) is not None
+
+    def stats(self) -> dict:
+        """会话数量与淘汰统计"""
+        with self._stats_lock:
+            evictions = dict(self.evictions)
+        return {
+            'active': len(self),
+            'max_sessions': self.max_sessions,
+            'ttl': self.ttl,
+            'evictions': evictions
+        }
+
+    def _evicted(self, evicted: List[Tuple[str, dict, str]]):
+        """记录淘汰并触发回调（须在存储锁外调用）"""
+        if not evicted:
+            return
+        with self._stats_lock:
+            for _, _, reason in evicted:
+                self.evictions[reason] += 1
+        if self.on_evict is None:
+            return
+        for user_id, session, reason in evicted:
+            try:
+                self.on_evict(user_id, session, reason)
+            except Exception as e:
+                print(f"[Session] 淘汰回调失败 {user_id}: {e}")
+
+    def _is_expired(self, updated_at: float, now: Optional[float] = None) -> bool:
+        return bool(self.ttl) and (now or time.time()) - updated_at > self.ttl
+
+
+class MemorySessionStore(SessionStore):
+    """进程内存储（单 worker 部署），按最近访问顺序做 LRU 淘汰"""
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self._sessions: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[dict]:
+        evicted = []
+        with self._lock:
+            item = self._sessions.get(user_id)
+            if item is None:
+                return None
+            if self._is_expired(item[1]):
+                del self._sessions[user_id]
+                evicted.append((user_id, item[0], 'ttl'))
+                session = None
+            else:
+                self._sessions.move_to_end(user_id)
+                session = item[0]
+        self._evicted(evicted)
+        return session
+
+    def put(self, user_id: str, session: dict):
+        evicted = []
+        with self._lock:
+            self._sessions[user_id] = (session, time.time())
+            self._sessions.move_to_end(user_id)
+            while self.max_sessions and len(self._sessions) > self.max_sessions:
+                uid, (old, _) = self._sessions.popitem(last=False)
+                evicted.append((uid, old, 'capacity'))
+        self._evicted(evicted)
+
+    def delete(self, user_id: str, session: Optional[dict] = None):
+        with self._lock:
+            self._sessions.pop(user_id, None)
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        evicted = []
+        with self._lock:
+            # 按访问时间有序，遇到未过期即可停止
+            while self._sessions:
+                uid, (session, ts) = next(iter(self._sessions.items()))
+                if not self._is_expired(ts, now):
+                    break
+                del self._sessions[uid]
+                evicted.append((uid, session, 'ttl'))
+        self._evicted(evicted)
+        return len(evicted)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SQLite 存储（WAL 模式），多个 worker / 重启后共享会话
+
+    按 user_id 哈希分片到多个数据库文件，降低写锁竞争；
+    每次写入版本号加一，读出的会话带版本号，写回时比较并交换：
+    同一用户的请求落在不同 worker 上时，后写回的一方得到 SessionConflict，而不是静默覆盖
+    """
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.path = Path(config.get('path', './data/sessions.db'))
+        self.shards = max(1, config.get('shards', 4))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+
+        for shard in range(self.shards):
+            conn = self._conn(shard)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    user_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    version INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            # 旧库升级：补版本列
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+            if 'version' not in columns:
+                conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at)")
+            conn.commit()
+
+    def _shard_path(self, shard: int) -> Path:
+        if self.shards == 1:
+            return self.path
+        return self.path.with_name(f"{self.path.stem}_{shard}{self.path.suffix}")
+
+    def _shard_of(self, user_id: str) -> int:
+        return zlib.crc32(user_id.encode('utf-8')) % self.shards
+
+    def _conn(self, shard: int) -> sqlite3.Connection:
+        """每个线程每个分片一个连接"""
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = {}
+        conn = conns.get(shard)
+        if conn is None:
+            conn = sqlite3.connect(str(self._shard_path(shard)), timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conns[shard] = conn
+        return conn
+
+    def get(self, user_id: str) -> Optional[dict]:
+        conn = self._conn(self._shard_of(user_id))
+        row = conn.execute(
+            "SELECT data, updated_at, version FROM sessions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if self._is_expired(row[1]):
+            deleted = conn.execute(
+                "DELETE FROM sessions WHERE user_id = ? AND version = ?", (user_id, row[2])
+            ).rowcount
+            conn.commit()
+            if deleted:
+                self._evicted([(user_id, _loads(row[0]), 'ttl')])
+            return None
+        session = _loads(row[0])
+        session[VERSION_KEY] = row[2]
+        return session
+
+    def put(self, user_id: str, session: dict):
+        conn = self._conn(self._shard_of(user_id))
+        expected = session.get(VERSION_KEY)
+        data = _dumps({k: v for k, v in session.items() if k != VERSION_KEY})
+        now = time.time()
+        if expected is None:
+            # 新会话（开始训练）：覆盖该用户的旧会话
+            conn.execute(
+                "INSERT INTO sessions (user_id, data, updated_at, version) VALUES (?, ?, ?, 1) "
+                "ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, "
+                "updated_at = excluded.updated_at, version = sessions.version + 1",
+                (user_id, data, now)
+            )
+            version = conn.execute("SELECT version FROM sessions WHERE user_id = ?", (user_id,)).fetchone()[0]
+        else:
+            updated = conn.execute(
+                "UPDATE sessions SET data = ?, updated_at = ?, version = version + 1 "
+                "WHERE user_id = ? AND version = ?",
+                (data, now, user_id, expected)
+            ).rowcount
+            if not updated:
+                conn.rollback()
+                raise SessionConflict("训练会话已在其他请求中更新，请重试")
+            version = expected + 1
+        conn.commit()
+        session[VERSION_KEY] = version
+
+    def delete(self, user_id: str, session: Optional[dict] = None):
+        conn = self._conn(self._shard_of(user_id))
+        expected = session.get(VERSION_KEY) if session is not None else None
+        if expected is None:
+            conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        elif not conn.execute(
+                "DELETE FROM sessions WHERE user_id = ? AND version = ?", (user_id, expected)).rowcount:
+            conn.rollback()
+            raise SessionConflict("训练会话已在其他请求中更新，请重试")
+        conn.commit()
+
+    def purge_expired(self) -> int:
+        if not self.ttl:
+            return 0
+        deadline = time.time() - self.ttl
+        evicted = []
+        for shard in range(self.shards):
+            conn = self._conn(shard)
+            # 先取出再按 updated_at 条件删除，避免误删期间被更新的会话
+            rows = conn.execute(
+                "SELECT user_id, data, updated_at FROM sessions WHERE updated_at < ?", (deadline,)
+            ).fetchall()
+            for user_id, data, updated_at in rows:
+                deleted = conn.execute(
+                    "DELETE FROM sessions WHERE user_id = ? AND updated_at = ?", (user_id, updated_at)
+                ).rowcount
+                if deleted:
+                    evicted.append((user_id, _loads(data), 'ttl'))
+            conn.commit()
+        self._evicted(evicted)
+        return len(evicted)
+
+    def __len__(self) -> int:
+        return sum(
+            self._conn(shard).execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            for shard in range(self.shards)
+        )
+
+
+class SessionLocks:
+    """
+    用户级会话锁：同一用户的请求串行处理，同步（执行池线程）与异步（事件循环）路径共用同一把锁
+
+    锁按引用计数登记，没有持有者和等待者时立即移除（会话结束后不会残留），
+    数量只与进行中的请求有关
+    """
+
+    def __init__(self, poll_interval: float = 0.005):
+        self.poll_interval = poll_interval
+        self._locks: Dict[str, list] = {}  # user_id -> [锁, 引用数]
+        self._guard = threading.Lock()
+
+    def _ref(self, user_id: str) -> threading.Lock:
+        with self._guard:
+            entry = self._locks.get(user_id)
+            if entry is None:
+                entry = self._locks[user_id] = [threading.Lock(), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def _unref(self, user_id: str):
+        with self._guard:
+            entry = self._locks[user_id]
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[user_id]
+
+    @contextmanager
+    def hold(self, user_id: str) -> Iterator[None]:
+        """持有用户锁（线程中使用）"""
+        lock = self._ref(user_id)
+        try:
+            with lock:
+                yield
+        finally:
+            self._unref(user_id)
+
+    @asynccontextmanager
+    async def ahold(self, user_id: str) -> AsyncIterator[None]:
+        """持有用户锁（协程中使用）：非阻塞轮询获取，等待期间不阻塞事件循环、不占用线程"""
+        lock = self._ref(user_id)
+        try:
+            while not lock.acquire(blocking=False):
+                await asyncio.sleep(self.poll_interval)
+            try:
+                yield
+            finally:
+                lock.release()
+        finally:
+            self._unref(user_id)
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class SessionSweeper(threading.Thread):
+    """后台清理线程，定期淘汰闲置会话"""
+
+    def __init__(self, store: SessionStore, interval: float):
+        super().__init__(name='session-sweeper', daemon=True)
+        self.store = store
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.store.purge_expired()
+            except Exception as e:
+                print(f"[Session] 清理失败: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def _dumps(session: dict) -> str:
+    return json.dumps(session, ensure_ascii=False, default=_encode_default)
+
+
+def _loads(data: str) -> dict:
+    return json.loads(data, object_hook=_decode_hook)
+
+
+def _encode_default(obj):
+    if isinstance(obj, datetime):
+        return {'__datetime__': obj.isoformat()}
+    raise TypeError(f"无法序列化 {type(obj).__name__}")
+
+
+def _decode_hook(obj: dict):
+    if len(obj) == 1 and '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    return obj
+
+
+SESSION_STORES = {
+    'memory': MemorySessionStore,
+    'sqlite': SQLiteSessionStore
+}
+
+
+def create_session_store(config: Optional[dict]) -> SessionStore:
+    """根据配置创建会话存储，默认使用内存存储"""
+    config = config or {}
+    store_cls = SESSION_STORES.get(config.get('store', 'memory'), MemorySessionStore)
+    return store_cls(config)
@@ -0,0 +1,495 @@
+"""
+训练记录存储 - SQLite（WAL）持久化，单写线程批量落盘
+"""
+
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS training_records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    department TEXT NOT NULL DEFAULT '',
+    project TEXT NOT NULL,
+    total_score INTEGER NOT NULL,
+    dimensions TEXT NOT NULL,
+    highlights TEXT NOT NULL,
+    improvements TEXT NOT NULL,
+    suggestion TEXT NOT NULL,
+    turn_count INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    abandoned TEXT,
+    dialogue TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_records_user_created ON training_records (user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_records_dept_created ON training_records (department, created_at);
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    day TEXT NOT NULL,
+    dimension TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    total REAL NOT NULL,
+    total_sq REAL NOT NULL,
+    PRIMARY KEY (scope, key, day, dimension)
+) WITHOUT ROWID;
+"""
+
+INSERT_SQL = """
+INSERT INTO training_records (
+    session_id, user_id, department, project, total_score, dimensions, highlights,
+    improvements, suggestion, turn_count, duration, abandoned, dialogue, created_at
+) VALUES (
+    :session_id, :user_id, :department, :project, :total_score, :dimensions, :highlights,
+    :improvements, :suggestion, :turn_count, :duration, :abandoned, :dialogue, :created_at
+)
+"""
+
+UPSERT_ROLLUP_SQL = """
+INSERT INTO daily_rollups (scope, key, day, dimension, count, total, total_sq)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (scope, key, day, dimension) DO UPDATE SET
+    count = count + excluded.count,
+    total = total + excluded.total,
+    total_sq = total_sq + excluded.total_sq
+"""
+
+# 日汇总维度：按用户 / 项目 / 科室
+ROLLUP_SCOPES = ('user_id', 'project', 'department')
+# 日汇总中代表综合得分的维度名
+TOTAL_DIMENSION = '__total__'
+
+# 报告读路径只取汇总字段，不读对话全文
+SUMMARY_COLUMNS = "session_id, user_id, department, project, total_score, dimensions, turn_count, duration, created_at"
+
+_STOP = object()
+
+# 写入重试：数据库暂时不可写（如 database is locked）时的首次退避时间（秒），之后翻倍
+RETRY_DELAY = 0.1
+# 停止写线程时，剩余记录最多尝试写入的次数
+FINAL_ATTEMPTS = 3
+
+logger = logging.getLogger(__name__)
+
+
+class TrainingStore:
+    """训练记录存储"""
+
+    def __init__(self, config: dict):
+        self.path = Path(config.get('path', './data/training.db'))
+        self.batch_size = config.get('batch_size', 200)
+        self.flush_interval = config.get('flush_interval', 0.2)
+        self.retry_max_delay = config.get('retry_max_delay', 5.0)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        # 旧库升级：已有记录但尚无日汇总时回填
+        if (conn.execute("SELECT 1 FROM training_records LIMIT 1").fetchone()
+                and not conn.execute("SELECT 1 FROM daily_rollups LIMIT 1").fetchone()):
+            self.rebuild_rollups()
+
+        # 写入经由队列交给单一写线程，请求线程不等待 fsync
+        self._queue: "queue.Queue" = queue.Queue()
+        # 已提交未落盘的记录，读路径合并返回，保证刚结束的训练立即可见
+        self._pending: List[dict] = []
+        self._pending_lock = threading.Lock()
+        # 写线程在此锁内提交并移出 _pending，读路径在此锁内读数据库和 _pending，记录不会重复或遗漏
+        self._visible_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._write_loop, name='training-writer', daemon=True)
+        self._writer.start()
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程一个连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def save(self, record: dict):
+        """
+        异步保存一条训练记录
+
+        Args:
+            record: 训练记录，字段见 build_record
+        """
+        # 无法汇总的记录不进入 _pending，以免读路径合并时出错
+        try:
+            _rollup_cells([record])
+        except Exception:
+            logger.exception("训练记录格式错误，已丢弃（session_id=%s）", record.get('session_id'))
+            return
+        # 同一把锁内入队，保证 _pending 与队列顺序一致
+        with self._pending_lock:
+            self._pending.append(record)
+            self._queue.put(record)
+
+    def flush(self, timeout: float = 5.0):
+        """等待队列中已提交的记录全部落盘"""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        """写入剩余记录并停止写线程"""
+        self._queue.put(_STOP)
+        self._writer.join(timeout=10)
+
+    def get_user_history(self, user_id: str, days: int = 7) -> List[dict]:
+        """获取用户近 N 天的训练记录（按时间倒序）"""
+        with self._visible_lock:
+            rows = self._conn().execute(
+                f"SELECT {SUMMARY_COLUMNS} FROM training_records "
+                "WHERE user_id = ? AND created_at >= ? ORDER BY created_at DESC",
+                (user_id, time.time() - days * 86400)
+            ).fetchall()
+            pending = self._pending_for('user_id', user_id, days)
+        return pending + [_summary(row) for row in rows]
+
+    def get_department_history(self, department: str, days: int = 7) -> List[dict]:
+        """获取科室近 N 天的训练记录（按时间倒序）"""
+        with self._visible_lock:
+            rows = self._conn().execute(
+                f"SELECT {SUMMARY_COLUMNS} FROM training_records "
+                "WHERE department = ? AND created_at >= ? ORDER BY created_at DESC",
+                (department, time.time() - days * 86400)
+            ).fetchall()
+            pending = self._pending_for('department', department, days)
+        return pending + [_summary(row) for row in rows]
+
+    def get_rollup(self, scope: str, key: str, days: int = 7) -> dict:
+        """
+        读取日汇总（O(天数)，不扫描训练记录）
+
+        Args:
+            scope: user_id / project / department
+            key: 对应的用户ID、项目名或科室名
+            days: 最近 N 个自然日（含今天）
+
+        Returns:
+            {'count', 'avg_score', 'dimensions': {维度: {'count', 'avg', 'std'}},
+             'daily': [{'day', 'count', 'avg_score'}]}
+        """
+        day_list = [_day(time.time() - i * 86400) for i in range(days - 1, -1, -1)]
+        with self._visible_lock:
+            rows = self._conn().execute(
+                "SELECT day, dimension, count, total, total_sq FROM daily_rollups "
+                "WHERE scope = ? AND key = ? AND day >= ?",
+                (scope, key, day_list[0])
+            ).fetchall()
+            with self._pending_lock:
+                pending = [r for r in self._pending if r[scope] == key]
+        cells = {(row['day'], row['dimension']): [row['count'], row['total'], row['total_sq']] for row in rows}
+
+        # 合并尚未落盘的记录
+        for (_, _, day, dim), (count, total, total_sq) in _rollup_cells(pending, scopes=(scope,)).items():
+            if day < day_list[0]:
+                continue
+            cell = cells.setdefault((day, dim), [0, 0.0, 0.0])
+            cell[0] += count
+            cell[1] += total
+            cell[2] += total_sq
+
+        merged = {}
+        for (day, dim), (count, total, total_sq) in cells.items():
+            acc = merged.setdefault(dim, [0, 0.0, 0.0])
+            acc[0] += count
+            acc[1] += total
+            acc[2] += total_sq
+
+        total_cell = merged.pop(TOTAL_DIMENSION, [0, 0.0, 0.0])
+        daily = []
+        for day in day_list:
+            count, total, _ = cells.get((day, TOTAL_DIMENSION), (0, 0.0, 0.0))
+            daily.append({'day': day, 'count': count, 'avg_score': total / count if count else 0.0})
+
+        return {
+            'count': total_cell[0],
+            'avg_score': total_cell[1] / total_cell[0] if total_cell[0] else 0.0,
+            'dimensions': {
+                dim: {
+                    'count': count,
+                    'avg': total / count,
+                    'std': max(0.0, total_sq / count - (total / count) ** 2) ** 0.5
+                }
+                for dim, (count, total, total_sq) in merged.items() if count
+            },
+            'daily': daily
+        }
+
+    def iter_dialogues(self, since: float = 0, until: float = None, chunk_size: int = 1000):
+        """
+        按 id 分块流式读取对话（批量重评分用），不一次性载入内存
+
+        Yields:
+            [(id, project, dialogue_json)]
+        """
+        conn = self._conn()
+        last_id = 0
+        until = until or time.time()
+        while True:
+            rows = conn.execute(
+                "SELECT id, project, dialogue FROM training_records "
+                "WHERE id > ? AND created_at >= ? AND created_at <= ? ORDER BY id LIMIT ?",
+                (last_id, since, until, chunk_size)
+            ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1]['id']
+            yield [tuple(row) for row in rows]
+
+    def count_records(self, since: float = 0, until: float = None) -> int:
+        """统计时间范围内的记录数"""
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM training_records WHERE created_at >= ? AND created_at <= ?",
+            (since, until or time.time())
+        ).fetchone()[0]
+
+    def update_scores(self, updates: List[dict]):
+        """
+        批量更新评分（不更新日汇总，全部更新完成后调用 rebuild_rollups）
+
+        Args:
+            updates: [{'id', 'total_score', 'dimensions', 'highlights', 'improvements', 'suggestion'}]，
+                     列表字段为 JSON 字符串
+        """
+        with self._conn() as conn:
+            conn.executemany(
+                "UPDATE training_records SET total_score = :total_score, dimensions = :dimensions, "
+                "highlights = :highlights, improvements = :improvements, suggestion = :suggestion "
+                "WHERE id = :id",
+                updates
+            )
+
+    def rebuild_rollups(self, chunk_size: int = 5000):
+        """
+        根据训练记录全量重建日汇总（评分规则变更或旧库升级时使用）
+
+        按 id 分块聚合到本连接的临时表（不占用主库写锁，写线程照常落盘），
+        最后在一个短事务内替换日汇总，并补上重建期间新写入的记录
+        """
+        conn = self._conn()
+        conn.execute("DROP TABLE IF EXISTS temp.rollup_rebuild")
+        conn.execute(
+            "CREATE TEMP TABLE rollup_rebuild (scope TEXT, key TEXT, day TEXT, dimension TEXT, "
+            "count INTEGER, total REAL, total_sq REAL, PRIMARY KEY (scope, key, day, dimension)) WITHOUT ROWID"
+        )
+        upsert = UPSERT_ROLLUP_SQL.replace('daily_rollups', 'temp.rollup_rebuild')
+        try:
+            last_id = 0
+            while True:
+                rows = self._rollup_source(conn, last_id, chunk_size)
+                if not rows:
+                    break
+                last_id = rows[-1]['id']
+                with conn:
+                    conn.executemany(upsert, _rollup_rows(rows))
+
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("DELETE FROM daily_rollups")
+                conn.execute(
+                    "INSERT INTO daily_rollups (scope, key, day, dimension, count, total, total_sq) "
+                    "SELECT scope, key, day, dimension, count, total, total_sq FROM temp.rollup_rebuild"
+                )
+                conn.executemany(UPSERT_ROLLUP_SQL, _rollup_rows(self._rollup_source(conn, last_id)))
+        finally:
+            conn.execute("DROP TABLE IF EXISTS temp.rollup_rebuild")
+
+    def _rollup_source(self, conn: sqlite3.Connection, after_id: int, limit: int = -1) -> list:
+        """按 id 顺序读取 after_id 之后的记录（日汇总所需字段）"""
+        return conn.execute(
+            "SELECT id, user_id, project, department, total_score, dimensions, created_at "
+            "FROM training_records WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit)
+        ).fetchall()
+
+    def _pending_for(self, field: str, value: str, days: int) -> List[dict]:
+        since = time.time() - days * 86400
+        with self._pending_lock:
+            records = [r for r in self._pending if r[field] == value and r['created_at'] >= since]
+        return [_summary(r) for r in reversed(records)]
+
+    def _write_loop(self):
+        conn = self._conn()
+        while True:
+            batch, waiters, stop = self._next_batch()
+            try:
+                if batch:
+                    self._write_batch(conn, batch, final=stop)
+            except Exception:
+                # 兜底：写线程不能退出，否则之后的记录全部滞留在队列中
+                logger.exception("训练记录写入异常，丢弃未写入的记录")
+                self._retire(batch)
+            finally:
+                for waiter in waiters:
+                    waiter.set()
+            if stop:
+                return
+
+    def _next_batch(self):
+        """凑批：在 flush_interval 内尽量多取，返回 (记录, flush 等待者, 是否停止)"""
+        item = self._queue.get()
+        batch, waiters, stop = [], [], False
+        deadline = time.time() + self.flush_interval
+        while True:
+            if item is _STOP:
+                stop = True
+            elif isinstance(item, threading.Event):
+                waiters.append(item)
+            else:
+                batch.append(item)
+            if stop or len(batch) >= self.batch_size:
+                break
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.time()))
+            except queue.Empty:
+                break
+        return batch, waiters, stop
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[dict], final: bool = False):
+        """
+        写入一批记录（记录与日汇总在同一事务内更新）
+
+        数据库暂时不可写时按指数退避重试，期间记录保留在 _pending 中、读路径照常可见；
+        批内有无法写入的记录（字段缺失、格式错误）时改为逐条写入，只丢弃出错的记录
+        """
+        remaining = list(batch)
+        isolate = False
+        delay = RETRY_DELAY
+        attempts = 0
+        while remaining:
+            try:
+                if isolate:
+                    while remaining:
+                        self._insert_one(conn, remaining[0])
+                        remaining.pop(0)
+                else:
+                    self._insert(conn, remaining)
+                    remaining = []
+            except sqlite3.OperationalError as e:
+                attempts += 1
+                if final and attempts >= FINAL_ATTEMPTS:
+                    logger.error("训练记录写入失败，停止前丢弃 %d 条记录: %s", len(remaining), e)
+                    self._retire(remaining)
+                    return
+                logger.warning("训练记录写入失败（第 %d 次），%.1f 秒后重试: %s", attempts, delay, e)
+                time.sleep(delay)
+                delay = min(delay * 2, self.retry_max_delay)
+            except Exception as e:
+                logger.warning("批量写入训练记录出错，改为逐条写入: %s", e)
+                isolate = True
+
+    def _insert(self, conn: sqlite3.Connection, records: List[dict]):
+        """写入并移出 _pending（同一临界区内，读路径看到的要么是数据库中的记录，要么是 _pending 中的）"""
+        rollups = [key + tuple(value) for key, value in _rollup_cells(records).items()]
+        # 等待写锁与写入都在临界区外，读路径只在提交瞬间等待
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(INSERT_SQL, records)
+            conn.executemany(UPSERT_ROLLUP_SQL, rollups)
+            with self._visible_lock:
+                conn.commit()
+                self._retire(records)
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def _retire(self, records: List[dict]):
+        """从 _pending 头部移出已写入或已丢弃的记录（_pending 与写入顺序一致）"""
+        retired = {id(record) for record in records}
+        with self._pending_lock:
+            count = 0
+            while count < len(self._pending) and id(self._pending[count]) in retired:
+                count += 1
+            del self._pending[:count]
+
+    def _insert_one(self, conn: sqlite3.Connection, record: dict):
+        """写入单条记录，无法写入时记录日志并丢弃（数据库暂时不可写的错误向上抛出以便重试）"""
+        try:
+            self._insert(conn, [record])
+        except sqlite3.OperationalError:
+            raise
+        except Exception:
+            logger.exception("训练记录无法写入，已丢弃（session_id=%s）", record.get('session_id'))
+            self._retire([record])
+
+
+def build_record(user_id: str, session: dict, evaluation: dict, department: str = '',
+                 dialogue: Optional[List[dict]] = None) -> dict:
+    """将会话与评估结果转换为存储记录，dialogue 为展开后的对话（默认取会话中的 dialogue_history）"""
+    start_time = session.get('start_time')
+    now = time.time()
+    return {
+        'session_id': session['session_id'],
+        'user_id': user_id,
+        'department': department or '',
+        'project': session['project'],
+        'total_score': evaluation['total_score'],
+        'dimensions': json.dumps(evaluation['dimensions'], ensure_ascii=False),
+        'highlights': json.dumps(evaluation['highlights'], ensure_ascii=False),
+        'improvements': json.dumps(evaluation['improvements'], ensure_ascii=False),
+        'suggestion': evaluation['suggestion'],
+        'turn_count': session['turn_count'],
+        'duration': now - start_time.timestamp() if start_time else 0,
+        'abandoned': evaluation.get('abandoned'),
+        'dialogue': json.dumps(session['dialogue_history'] if dialogue is None else dialogue, ensure_ascii=False),
+        'created_at': now
+    }
+
+
+def _day(timestamp: float) -> str:
+    return time.strftime('%Y-%m-%d', time.localtime(timestamp))
+
+
+def _rollup_cells(records: List[dict], scopes=ROLLUP_SCOPES) -> dict:
+    """将一批记录聚合为 (scope, key, day, dimension) -> [count, total, total_sq]"""
+    cells = {}
+    for record in records:
+        day = _day(record['created_at'])
+        scores = [(TOTAL_DIMENSION, record['total_score'])]
+        scores.extend(json.loads(record['dimensions']).items())
+        for scope in scopes:
+            key = record[scope]
+            if not key:
+                continue
+            for dim, score in scores:
+                cell = cells.setdefault((scope, key, day, dim), [0, 0.0, 0.0])
+                cell[0] += 1
+                cell[1] += score
+                cell[2] += score * score
+    return cells
+
+
+def _rollup_rows(rows) -> List[tuple]:
+    """数据库行 -> UPSERT_ROLLUP_SQL 参数"""
+    return [key + tuple(value) for key, value in _rollup_cells([dict(row) for row in rows]).items()]
+
+
+def _summary(row) -> dict:
+    return {
+        'session_id': row['session_id'],
+        'user_id': row['user_id'],
+        'department': row['department'],
+        'project': row['project'],
+        'score': row['total_score'],
+        'dimensions': json.loads(row['dimensions']),
+        'turn_count': row['turn_count'],
+        'duration': row['duration'],
+        'created_at': row['created_at']
+    }
+
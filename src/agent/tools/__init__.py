@@ -1,8 +1,19 @@
 """Agent 工具模块"""
 
-from .knowledge import KnowledgeTool
-from .evaluation import EvaluationTool
-from .scenario import ScenarioTool
-from .notification import NotificationTool
+import importlib
 
-__all__ = ['KnowledgeTool', 'EvaluationTool', 'ScenarioTool', 'NotificationTool']
+_MODULES = {
+    'KnowledgeTool': '.knowledge',
+    'EvaluationTool': '.evaluation',
+    'ScenarioTool': '.scenario',
+    'NotificationTool': '.notification',
+}
+
+__all__ = list(_MODULES)
+
+
+def __getattr__(name):
+    # 按需导入：工作进程只评估或解析时不加载知识库、场景等模块
+    if name in _MODULES:
+        return getattr(importlib.import_module(_MODULES[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,136 @@
+"""
+患者对话状态机 - 规则患者的轮次推进与回复选择（不调用 LLM）
+
+状态为场景 expected_flow 中的各阶段，转移由咨询师回复匹配到的意图决定；
+每种 (性格, 阶段序列) 编译一次为查表结构，单轮回复只需一次正则匹配和一次查表
+"""
+
+import random
+import re
+from typing import Dict, List, Sequence, Tuple
+
+# 咨询师意图 -> 关键词，按优先级排列（同时命中多个意图时取靠前的）
+INTENT_KEYWORDS = {
+    'close': ['预约', '安排', '名额', '定金', '下单', '今天就'],
+    'price': ['价格', '钱', '费用', '优惠', '分期', '活动'],
+    'effect': ['效果', '维持', '案例', '自然'],
+    'safety': ['安全', '放心', '风险', '认证', '正规', '资质'],
+}
+
+# 未命中任何意图
+DEFAULT_INTENT = '*'
+
+_INTENT_PATTERN = re.compile('|'.join(
+    f"(?P<{intent}>{'|'.join(map(re.escape, words))})" for intent, words in INTENT_KEYWORDS.items()
+))
+
+_ENDINGS = (
+    "好的，那帮我预约吧。",
+    "行，那我先考虑一下，回头联系你。",
+    "可以，我想先看看案例再决定。",
+    "这个价格还是有点贵，我再对比对比。"
+)
+
+# 阶段 -> {性格: {意图: 回复模板}}，性格、意图为 '*' 表示默认；
+# 模板可用字段：concern、project、question、objection
+STAGE_REPLIES = {
+    '需求挖掘': {
+        '价格敏感型': {'*': ("我主要是想改善{concern}，大概多少钱啊？",)},
+        '犹豫型': {'*': ("{concern}困扰我很久了，但怕疼，也怕效果不好...",)},
+        '*': {'*': ("{concern}比较明显，想了解一下{project}的效果。",)},
+    },
+    '产品介绍': {
+        '*': {
+            'price': ("这个价格有点超预算，有没有优惠或者分期？",),
+            'effect': ("能维持多久？需要经常补打吗？",),
+            'safety': ("那具体怎么操作？疼不疼？",),
+            '*': ("{question}",),
+        },
+    },
+    '异议处理': {
+        '犹豫型': {'*': ("{objection}，我想再考虑考虑。",)},
+        '价格敏感型': {'*': ("{objection}，能不能再便宜点？",)},
+        '*': {'*': ("听起来不错，那什么时候可以安排？",)},
+    },
+    '促成转化': {
+        '冲动型': {'close': ("好的，那帮我预约吧。",), '*': _ENDINGS},
+        '*': {'*': _ENDINGS},
+    },
+}
+
+# 未知阶段的回复
+_FALLBACK_REPLIES = {'*': ("{question}",)}
+
+# (性格, 意图) -> 跳转到的阶段（只向后跳）
+INTENT_JUMPS = {
+    ('冲动型', 'close'): '促成转化',
+}
+
+
+def match_intent(message: str) -> str:
+    """匹配咨询师回复的意图，未命中返回 DEFAULT_INTENT"""
+    matched = {m.lastgroup for m in _INTENT_PATTERN.finditer(message)}
+    for intent in INTENT_KEYWORDS:
+        if intent in matched:
+            return intent
+    return DEFAULT_INTENT
+
+
+class DialogueMachine:
+    """
+    单个 (性格, 阶段序列) 的编译结果
+
+    table[状态][意图] = (回复模板, 下一状态)，状态为阶段序号；
+    默认逐轮进入下一阶段，停留在最后一个阶段
+    """
+
+    def __init__(self, personality: str, stages: Sequence[str]):
+        self.personality = personality
+        self.stages = tuple(stages) or ('需求挖掘',)
+        last = len(self.stages) - 1
+        intents = list(INTENT_KEYWORDS) + [DEFAULT_INTENT]
+
+        self.table: List[Dict[str, Tuple[Tuple[str, ...], int]]] = []
+        for index, stage in enumerate(self.stages):
+            replies = self._replies(stage)
+            row = {}
+            for intent in intents:
+                target = INTENT_JUMPS.get((personality, intent))
+                if target in self.stages and self.stages.index(target) > index:
+                    jump = self.stages.index(target)
+                    jump_replies = self._replies(target)
+                    row[intent] = (jump_replies.get(intent, jump_replies[DEFAULT_INTENT]), jump)
+                else:
+                    row[intent] = (replies.get(intent, replies[DEFAULT_INTENT]), min(index + 1, last))
+            self.table.append(row)
+
+    def _replies(self, stage: str) -> Dict[str, Tuple[str, ...]]:
+        """阶段在当前性格下的 {意图: 回复模板}（性格专属覆盖默认）"""
+        by_personality = STAGE_REPLIES.get(stage)
+        if by_personality is None:
+            return _FALLBACK_REPLIES
+        return {**by_personality.get('*', {}), **by_personality.get(self.personality, {})}
+
+    def step(self, state: int, consultant_msg: str, scenario: dict, rng: random.Random) -> Tuple[str, int]:
+        """
+        推进一轮
+
+        Args:
+            state: 当前状态（阶段序号）
+            consultant_msg: 咨询师回复
+            scenario: 场景（提供模板字段）
+            rng: 随机数生成器
+
+        Returns:
+            (患者回复, 下一状态)
+        """
+        state = min(max(state, 0), len(self.table) - 1)
+        templates, next_state = self.table[state][match_intent(consultant_msg)]
+        patient = scenario['patient']
+        reply = rng.choice(templates).format(
+            concern=patient['concern'],
+            project=scenario['project'],
+            question=rng.choice(patient['questions']),
+            objection=rng.choice(patient['objections'])
+        )
+        return reply, next_state
@@ -0,0 +1,148 @@
+"""
+文档解析 - 知识库文件的文本提取与结构化知识抽取
+
+同时是解析进程池的工作进程入口：只依赖标准库（PDF、Word 解析库按需导入），
+spawn 启动的工作进程导入本模块时不会加载 Agent 和知识库索引
+"""
+
+import io
+import time
+from pathlib import Path
+from typing import Tuple
+
+
+def parse_pdf(file_path: Path) -> str:
+    """解析 PDF 文件"""
+    try:
+        import PyPDF2
+        with open(file_path, 'rb') as f:
+            reader = PyPDF2.PdfReader(f)
+            # 逐页写入缓冲区，避免字符串反复拼接
+            buffer = io.StringIO()
+            for page in reader.pages:
+                buffer.write(page.extract_text() or '')
+                buffer.write("\n")
+        return buffer.getvalue()
+    except ImportError:
+        return f"[PDF解析需要PyPDF2] {file_path}"
+
+
+def parse_docx(file_path: Path) -> str:
+    """解析 Word 文件"""
+    try:
+        from docx import Document
+        doc = Document(file_path)
+        return "\n".join([para.text for para in doc.paragraphs])
+    except ImportError:
+        return f"[Word解析需要python-docx] {file_path}"
+
+
+def parse_markdown(file_path: Path) -> str:
+    """解析 Markdown 文件"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def parse_text(file_path: Path) -> str:
+    """解析文本文件"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+# 支持的文档类型 -> 解析函数
+PARSERS = {
+    '.pdf': parse_pdf,
+    '.docx': parse_docx,
+    '.doc': parse_docx,
+    '.md': parse_markdown,
+    '.txt': parse_text
+}
+
+
+def extract_knowledge(content: str, project_name: str) -> dict:
+    """从文本中提取结构化知识"""
+    knowledge = {
+        'name': project_name,
+        'raw_content': content,
+        'introduction': '',
+        'indications': [],
+        'contraindications': [],
+        'price_range': '',
+        'duration': '',
+        'faq': [],
+        'objections': [],
+        'key_points': []
+    }
+
+    # 使用简单规则提取，实际可用 NLP
+    lines = content.split('\n')
+    current_section = None
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        # 识别章节
+        if '介绍' in line or '简介' in line:
+            current_section = 'introduction'
+        elif '适应症' in line or '适合人群' in line:
+            current_section = 'indications'
+        elif '禁忌' in line:
+            current_section = 'contraindications'
+        elif '价格' in line or '费用' in line:
+            current_section = 'price'
+        elif '维持' in line or '效果' in line:
+            current_section = 'duration'
+        elif 'FAQ' in line or '常见问题' in line:
+            current_section = 'faq'
+        elif '异议' in line:
+            current_section = 'objections'
+        elif '要点' in line or '重点' in line:
+            current_section = 'key_points'
+        else:
+            # 收集内容
+            if current_section == 'introduction':
+                knowledge['introduction'] += line + ' '
+            elif current_section == 'indications':
+                if line.startswith(('•', '-', '*', '1.', '2.')):
+                    knowledge['indications'].append(line.lstrip('•-*0123456789. '))
+            elif current_section == 'contraindications':
+                if line.startswith(('•', '-', '*', '1.', '2.')):
+                    knowledge['contraindications'].append(line.lstrip('•-*0123456789. '))
+            elif current_section == 'price':
+                knowledge['price_range'] += line + ' '
+            elif current_section == 'duration':
+                knowledge['duration'] += line + ' '
+            elif current_section == 'faq':
+                # 简单解析 Q&A
+                if '？' in line or '?' in line:
+                    knowledge['faq'].append({'question': line, 'answer': ''})
+                elif knowledge['faq']:
+                    knowledge['faq'][-1]['answer'] += line + ' '
+            elif current_section == 'objections':
+                # 解析异议类型和应对
+                if '：' in line or ':' in line:
+                    parts = line.split('：', 1) if '：' in line else line.split(':', 1)
+                    knowledge['objections'].append({
+                        'type': parts[0].strip(),
+                        'response': parts[1].strip() if len(parts) > 1 else ''
+                    })
+            elif current_section == 'key_points':
+                if line.startswith(('•', '-', '*')):
+                    knowledge['key_points'].append(line.lstrip('•-* '))
+
+    return knowledge
+
+
+def ping(_) -> bool:
+    """进程池预热"""
+    return True
+
+
+def parse_file(file_path: str, project_name: str) -> Tuple[dict, float]:
+    """解析单个文件（工作进程入口），返回 (结构化知识, 耗时)"""
+    started = time.perf_counter()
+    path = Path(file_path)
+    content = PARSERS[path.suffix.lower()](path)
+    return extract_knowledge(content, project_name), time.perf_counter() - started
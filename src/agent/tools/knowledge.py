@@ -2,28 +2,72 @@
 知识库工具 - 读取和管理医院话术文档
 """
 
+import hashlib
+import multiprocessing
 import os
 import re
+import threading
+import time
+from collections import OrderedDict, deque
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 import json
 
+from . import doc_parser
+from .knowledge_store import KnowledgeCache, KnowledgeStore, ProjectKnowledge, TenantKnowledge, deep_size
+from .search_index import SearchIndex
+from .vector_index import VectorIndex, chunk_spans, clean_chunk
+
+
+# 未分医院部署时的默认命名空间
+DEFAULT_TENANT = 'default'
+
 
 class KnowledgeTool:
     """知识库管理工具"""
     
+    # 支持的文档类型 -> 解析函数
+    PARSERS = doc_parser.PARSERS
+    
     def __init__(self, config: dict):
         self.knowledge_path = Path(config['path'])
         self.auto_sync = config.get('auto_sync', True)
-        self.cache = {}
+        self.sync_interval = config.get('sync_interval', 3600)
+        # 访问时检查存储代数，其他 worker 导入或同步的内容及时可见
+        self.reload_check_interval = config.get('reload_check_interval', 1)
+        self._next_reload_check = 0.0
+        # 解析流水线：多进程并行，单文件超时和大小上限
+        self.parse_workers = config.get('parse_workers')
+        self.parse_timeout = config.get('parse_timeout', 120)
+        self.max_file_size = config.get('max_file_size_mb', 50) * 1024 * 1024
+        
+        # 片段向量索引：文档按 chunk_size 字切片，用于检索相关段落
+        self.chunk_size = config.get('chunk_size', 200)
+        self.chunk_overlap = config.get('chunk_overlap', 40)
+        self.vector_dim = config.get('vector_dim', 1024)
+        
+        # 解析结果持久化（同时作为同步清单），启动时只读清单，项目知识按需加载
+        self.store = KnowledgeStore(config.get('cache_path', './data/knowledge.db'), self.knowledge_path)
+        self._sync_lock = threading.Lock()
+        self.last_sync: dict = {}
+        
+        # 按医院加载的命名空间（LRU），已加载内容超过 max_cache_mb 时淘汰冷门医院
+        self.max_cache_bytes = int(config.get('max_cache_mb', 256) * 1024 * 1024)
+        self.evicted_tenants = 0
+        self._tenants: Dict[str, TenantKnowledge] = OrderedDict()
+        self._tenants_lock = threading.RLock()
+        self._reload()
         
-        # 初始化时加载知识库
+        # 后台定时同步（启动时先同步一次），不阻塞初始化
+        self.sync_scheduler = None
         if self.auto_sync:
-            self.sync()
+            self.sync_scheduler = KnowledgeSyncScheduler(self, self.sync_interval)
+            self.sync_scheduler.start()
     
     def sync(self) -> str:
         """
-        同步知识库，扫描并解析所有文档
+        增量同步知识库：未变更的文件沿用清单中的解析结果，
+        新增或内容变化的文件重新解析，已删除的文件移出知识库
         
         Returns:
             同步结果摘要
@@ -31,91 +75,394 @@ class KnowledgeTool:
         if not self.knowledge_path.exists():
             return f"知识库路径不存在: {self.knowledge_path}"
         
-        loaded_projects = []
+        files = [
+            file_path for file_path in sorted(self.knowledge_path.rglob('*'))
+            if file_path.is_file() and file_path.suffix.lower() in self.PARSERS
+        ]
+        report = self._sync_files(files, remove_missing=True)
+        
+        loaded_projects = sorted({
+            entry['project'] if entry['tenant'] == DEFAULT_TENANT else f"{entry['tenant']}/{entry['project']}"
+            for entry in self.store.manifest().values()
+        })
+        summary = (f"知识库同步完成，已加载 {len(loaded_projects)} 个项目: {', '.join(loaded_projects)}"
+                   f"（解析 {report['parsed']} 个文件，删除 {report['removed']} 个，未变更 {report['unchanged']} 个）")
+        if report['timings']:
+            slowest = sorted(report['timings'].items(), key=lambda item: -item[1])[:5]
+            summary += "\n解析耗时：" + "，".join(f"{path} {elapsed:.2f}s" for path, elapsed in slowest)
+        if report['failures']:
+            summary += "\n解析失败：" + "，".join(f"{path}（{error}）" for path, error in report['failures'].items())
+        return summary
+    
+    def ingest(self, file_path: Path) -> dict:
+        """
+        解析并索引单个文件（上传后调用，不扫描整个知识库）
+        
+        Args:
+            file_path: 知识库目录下的文件
+            
+        Returns:
+            同步报告，见 _sync_files
+        """
+        return self._sync_files([Path(file_path)], remove_missing=False)
+    
+    def _sync_files(self, files: List[Path], remove_missing: bool) -> dict:
+        """
+        同步指定文件：未变更的沿用存储中的解析结果，新增或内容变化的并行解析
         
-        # 扫描知识库目录
-        for file_path in self.knowledge_path.rglob('*'):
-            if file_path.is_file():
-                project_name = self._extract_project_name(file_path)
+        Args:
+            files: 知识库目录下的文件
+            remove_missing: 是否删除存储中有、files 中没有的文件（全量同步时）
+            
+        Returns:
+            {'time', 'parsed', 'removed', 'unchanged', 'timings': {路径: 秒}, 'failures': {路径: 原因}}
+        """
+        with self._sync_lock:
+            manifest = self.store.manifest()
+            seen = set()
+            touched = []
+            
+            # 筛出需要解析的文件
+            tasks = []
+            failures = {}
+            for file_path in files:
+                rel_path = file_path.relative_to(self.knowledge_path).as_posix()
+                seen.add(rel_path)
+                try:
+                    stat = file_path.stat()
+                except OSError as e:
+                    self._unreadable(rel_path, e, remove_missing, seen, failures)
+                    continue
+                entry = manifest.get(rel_path)
+                
+                # 修改时间和大小都未变，直接沿用
+                if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                    continue
                 
-                if file_path.suffix.lower() == '.pdf':
-                    content = self._parse_pdf(file_path)
-                elif file_path.suffix.lower() in ['.docx', '.doc']:
-                    content = self._parse_docx(file_path)
-                elif file_path.suffix.lower() == '.md':
-                    content = self._parse_markdown(file_path)
-                elif file_path.suffix.lower() == '.txt':
-                    content = self._parse_text(file_path)
-                else:
+                # 解析失败时暂用上一版结果，下次同步重试
+                if stat.st_size > self.max_file_size:
+                    failures[rel_path] = f"文件过大（{stat.st_size / 1024 / 1024:.1f}MB）"
                     continue
                 
-                # 解析结构化信息
-                knowledge = self._extract_knowledge(content, project_name)
-                self.cache[project_name] = knowledge
-                loaded_projects.append(project_name)
+                # 内容哈希未变（如仅 touch / 重新拷贝），只更新元数据
+                try:
+                    digest = _file_hash(file_path)
+                except OSError as e:
+                    self._unreadable(rel_path, e, remove_missing, seen, failures)
+                    continue
+                if entry and entry['hash'] == digest:
+                    touched.append((rel_path, stat.st_mtime, stat.st_size))
+                    continue
+                tasks.append((rel_path, str(file_path), self._extract_project_name(file_path),
+                              {'mtime': stat.st_mtime, 'size': stat.st_size, 'hash': digest}))
+            
+            # 并行解析
+            parsed = []
+            timings = {}
+            pipeline = ParsePipeline(self.parse_workers, self.parse_timeout)
+            for rel_path, task, knowledge, error, elapsed in pipeline.run(tasks):
+                timings[rel_path] = round(elapsed, 3)
+                if error:
+                    failures[rel_path] = error
+                    continue
+                tenant, department = self._namespace(rel_path)
+                parsed.append((rel_path, {**task[3], 'tenant': tenant, 'department': department,
+                                          'project': task[2]}, knowledge))
+            
+            removed = [p for p in manifest if p not in seen] if remove_missing else []
+            self.store.apply(parsed, touched, removed)
+            # 本进程或其他 worker 写入了新结果时重新加载
+            if self.store.generation() != self._generation:
+                self._reload()
+            
+            report = {
+                'time': time.time(),
+                'parsed': len(parsed),
+                'removed': len(removed),
+                'unchanged': len(seen) - len(parsed) - len(failures),
+                'timings': timings,
+                'failures': failures
+            }
+            if remove_missing:
+                self.last_sync = report
+            return report
+    
+    @staticmethod
+    def _unreadable(rel_path: str, error: OSError, remove_missing: bool, seen: set, failures: dict):
+        """
+        扫描后无法读取的文件：全量同步时已被删除或改名（编辑器临时文件、上传替换）的按已删除处理，
+        其他情况记为失败并沿用上一版结果；单个文件不影响本次同步的其余文件
+        """
+        if remove_missing and isinstance(error, FileNotFoundError):
+            seen.discard(rel_path)
+        else:
+            failures[rel_path] = f"文件读取失败: {error}"
+    
+    def _reload(self):
+        """存储内容变化后清空已加载的命名空间，下次访问时按新清单重新加载"""
+        with self._tenants_lock:
+            self._generation = self.store.generation()
+            self._tenants.clear()
+    
+    def _check_generation(self):
+        """其他 worker 写入了新的解析结果时重新加载（最多每 reload_check_interval 秒查询一次）"""
+        now = time.monotonic()
+        if now < self._next_reload_check:
+            return
+        self._next_reload_check = now + self.reload_check_interval
+        if self.store.generation() != self._generation:
+            self._reload()
+    
+    def _tenant(self, tenant: str) -> TenantKnowledge:
+        """获取医院的知识命名空间（首次访问时加载清单，最近使用的排在最后）"""
+        self._check_generation()
+        with self._tenants_lock:
+            namespace = self._tenants.get(tenant)
+            if namespace is None:
+                namespace = TenantKnowledge(tenant, KnowledgeCache(self.store, self.store.manifest(tenant)))
+                self._tenants[tenant] = namespace
+            self._tenants.move_to_end(tenant)
+        return namespace
+    
+    def _enforce_memory(self, current: TenantKnowledge):
+        """已加载内容超出上限时，淘汰最久未访问的医院（当前医院除外）"""
+        with self._tenants_lock:
+            total = sum(ns.memory_bytes for ns in self._tenants.values())
+            for tenant in list(self._tenants):
+                if total <= self.max_cache_bytes:
+                    break
+                namespace = self._tenants[tenant]
+                if namespace is current:
+                    continue
+                total -= namespace.memory_bytes
+                del self._tenants[tenant]
+                self.evicted_tenants += 1
+    
+    def _indexes(self, tenant: str) -> Tuple[SearchIndex, SearchIndex, VectorIndex]:
+        """医院的 FAQ / 异议 / 片段向量索引（首次查询时构建）"""
+        namespace = self._tenant(tenant)
+        index = namespace.index
+        if index is None:
+            with namespace.index_lock:
+                index = namespace.index
+                if index is None:
+                    index = self._build_index(namespace.cache)
+                    namespace.index_bytes = deep_size(index)
+                    namespace.index = index
+            self._enforce_memory(namespace)
+        return index
+    
+    @property
+    def cache(self) -> KnowledgeCache:
+        """默认医院的项目缓存"""
+        return self._tenant(DEFAULT_TENANT).cache
+    
+    def tenants(self) -> List[str]:
+        """知识库中的全部医院"""
+        return sorted({entry['tenant'] for entry in self.store.manifest().values()})
+    
+    def memory_stats(self) -> dict:
+        """已加载命名空间的内存占用估算（字节），含每个已加载项目的占用；原文在磁盘，不计入"""
+        with self._tenants_lock:
+            namespaces = list(self._tenants.values())
+        tenants = {}
+        for ns in namespaces:
+            loaded = ns.cache.loaded
+            tenants[ns.tenant] = {
+                'projects': len(ns.cache),
+                'loaded_projects': {
+                    f"{department}/{project}" if department else project: knowledge.nbytes
+                    for (department, project), knowledge in sorted(loaded.items())
+                },
+                'raw_bytes_on_disk': sum(k.raw_length for k in loaded.values()),
+                'index_bytes': ns.index_bytes,
+                'memory_bytes': ns.memory_bytes,
+                'indexed': ns.index is not None
+            }
+        return {
+            'max_cache_bytes': self.max_cache_bytes,
+            'evicted_tenants': self.evicted_tenants,
+            'total_bytes': sum(t['memory_bytes'] for t in tenants.values()),
+            'tenants': tenants
+        }
+    
+    def find_project(self, project_name: str, tenant: str = DEFAULT_TENANT,
+                     department: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        """
+        在医院命名空间中模糊匹配项目
         
-        return f"知识库同步完成，已加载 {len(loaded_projects)} 个项目: {', '.join(loaded_projects)}"
+        Args:
+            project_name: 项目名称
+            tenant: 医院
+            department: 科室，指定时优先匹配该科室，其次匹配不属于任何科室的通用文档
+            
+        Returns:
+            (科室, 项目名)，未找到时为 None
+        """
+        matches = [
+            key for key in self._tenant(tenant).cache
+            if project_name in key[1] or key[1] in project_name
+        ]
+        if department is not None:
+            matches = [key for key in matches if key[0] == department] or [key for key in matches if not key[0]]
+        return matches[0] if matches else None
     
-    def get_project_knowledge(self, project_name: str) -> dict:
+    def get_project_knowledge(self, project_name: str, tenant: str = DEFAULT_TENANT,
+                              department: Optional[str] = None) -> ProjectKnowledge:
         """
         获取指定项目的知识
         
         Args:
             project_name: 项目名称
+            tenant: 医院
+            department: 科室（可选），见 find_project
             
         Returns:
-            项目知识字典
+            项目知识（不含原文，见 get_raw_content）
         """
-        # 模糊匹配
-        for name, knowledge in self.cache.items():
-            if project_name in name or name in project_name:
-                return knowledge
+        # 模糊匹配（只加载命中的项目）
+        key = self.find_project(project_name, tenant, department)
+        if key is not None:
+            namespace = self._tenant(tenant)
+            knowledge = namespace.cache[key]
+            self._enforce_memory(namespace)
+            return knowledge
         
         # 返回默认知识
         return self._get_default_knowledge(project_name)
     
-    def search_faq(self, query: str, top_k: int = 3) -> List[dict]:
+    def get_raw_content(self, project_name: str, tenant: str = DEFAULT_TENANT,
+                        department: Optional[str] = None) -> str:
+        """从磁盘读取项目原文（不缓存），未找到时为空字符串"""
+        key = self.find_project(project_name, tenant, department)
+        if key is None:
+            return ''
+        return self.store.read_text(self._tenant(tenant).cache[key].rel_path)
+    
+    def search_faq(self, query: str, top_k: int = 3, project: Optional[str] = None,
+                   tenant: str = DEFAULT_TENANT, department: Optional[str] = None) -> List[dict]:
         """
-        搜索 FAQ
+        搜索 FAQ（BM25 相关度排序）
         
         Args:
             query: 搜索关键词
             top_k: 返回结果数量
+            project: 只搜索指定项目（可选）
+            tenant: 医院
+            department: 只搜索该科室及通用文档（可选）
             
         Returns:
             FAQ 列表
         """
-        results = []
-        
-        for project_name, knowledge in self.cache.items():
-            for faq in knowledge.get('faq', []):
-                if query in faq['question'] or query in faq['answer']:
-                    results.append({
-                        'project': project_name,
-                        'question': faq['question'],
-                        'answer': faq['answer']
-                    })
+        return self._search(self._indexes(tenant)[0], query, top_k, project, department)
+    
+    def search_objections(self, query: str, top_k: int = 3, project: Optional[str] = None,
+                          tenant: str = DEFAULT_TENANT, department: Optional[str] = None) -> List[dict]:
+        """搜索异议处理话术（BM25 相关度排序）"""
+        return self._search(self._indexes(tenant)[1], query, top_k, project, department)
+    
+    def retrieve(self, query: str, top_k: int = 3, project: Optional[str] = None,
+                 min_score: float = 0.05, tenant: str = DEFAULT_TENANT,
+                 department: Optional[str] = None) -> List[dict]:
+        """
+        检索与查询最相关的文档片段（向量余弦相似度）
         
-        return results[:top_k]
+        Args:
+            query: 查询文本（患者问题、咨询师回复等）
+            top_k: 返回结果数量
+            project: 只检索指定项目（可选）
+            min_score: 最低相似度
+            tenant: 医院
+            department: 只检索该科室及通用文档（可选）
+            
+        Returns:
+            [{'department', 'project', 'text', 'score'}]
+        """
+        index = self._indexes(tenant)[2]
+        doc_filter = _doc_filter(index.docs, project, department)
+        if doc_filter is not None and not doc_filter:
+            return []
+        results = []
+        for doc_id, score in index.search(query, top_k=top_k, min_score=min_score, doc_filter=doc_filter):
+            doc = index.docs[doc_id]
+            # 片段只记录原文位置，命中后再从磁盘读取
+            text = self.store.read_text(doc['rel_path'], doc['offset'], doc['length'])
+            results.append({
+                'department': doc['department'],
+                'project': doc['project'],
+                'text': clean_chunk(text),
+                'score': round(score, 4)
+            })
+        return results
     
-    def get_objection_handling(self, objection_type: str) -> List[dict]:
+    def get_objection_handling(self, objection_type: str, tenant: str = DEFAULT_TENANT) -> List[dict]:
         """
         获取异议处理话术
         
         Args:
             objection_type: 异议类型，如"价格","效果","安全"
+            tenant: 医院
             
         Returns:
-            应对话术列表
+            应对话术列表，按相关度排序
         """
-        results = []
+        index = self._indexes(tenant)[1]
+        # 倒排表求交得到候选，再按类型子串精确过滤
+        candidates = [
+            doc_id for doc_id in index.candidates(objection_type)
+            if objection_type in index.docs[doc_id]['type']
+        ]
+        ranked = index.search(objection_type, top_k=len(candidates), doc_filter=candidates)
+        return [
+            {'type': index.docs[doc_id]['type'], 'response': index.docs[doc_id]['response']}
+            for doc_id, _ in ranked
+        ]
+    
+    def _build_index(self, cache: KnowledgeCache) -> Tuple[SearchIndex, SearchIndex, VectorIndex]:
+        """根据一个医院的缓存构建 FAQ / 异议 / 片段向量索引"""
+        faq_index, objection_index = SearchIndex(), SearchIndex()
+        texts, chunks = [], []
         
-        for knowledge in self.cache.values():
-            for obj in knowledge.get('objections', []):
-                if objection_type in obj['type']:
-                    results.append(obj)
+        for (department, project_name), knowledge in cache.items():
+            source = {'department': department, 'project': project_name}
+            for faq in knowledge.faq:
+                faq_index.add(f"{faq.question} {faq.answer}",
+                              {**source, 'question': faq.question, 'answer': faq.answer})
+            for obj in knowledge.objections:
+                objection_index.add(f"{obj.type} {obj.response}",
+                                    {**source, 'type': obj.type, 'response': obj.response})
+            
+            # 原文只在构建期间读入，片段记录字节偏移，检索命中后再按偏移读取
+            if not knowledge.raw_length:
+                continue
+            raw = self.store.read_text(knowledge.rel_path)
+            spans = chunk_spans(raw, self.chunk_size, self.chunk_overlap)
+            for (start, end), (offset, length) in zip(spans, _byte_spans(raw, spans)):
+                texts.append(raw[start:end])
+                chunks.append({**source, 'rel_path': knowledge.rel_path, 'offset': offset, 'length': length})
         
-        return results
+        vector_index = VectorIndex(self.vector_dim).build(texts, chunks)
+        return faq_index, objection_index, vector_index
+    
+    def _search(self, index: SearchIndex, query: str, top_k: int, project: Optional[str],
+                department: Optional[str]) -> List[dict]:
+        doc_filter = _doc_filter(index.docs, project, department)
+        return [
+            {**index.docs[doc_id], 'score': round(score, 4)}
+            for doc_id, score in index.search(query, top_k=top_k, doc_filter=doc_filter)
+        ]
+    
+    def _namespace(self, rel_path: str) -> Tuple[str, str]:
+        """
+        由文件相对路径确定命名空间 (医院, 科室)：
+        医院/科室/…/文件、科室/文件（默认医院）、文件（默认医院，通用文档）
+        """
+        parts = rel_path.split('/')[:-1]
+        if len(parts) >= 2:
+            return parts[0], parts[1]
+        if parts:
+            return DEFAULT_TENANT, parts[0]
+        return DEFAULT_TENANT, ''
     
     def _extract_project_name(self, file_path: Path) -> str:
         """从文件名提取项目名"""
@@ -124,116 +471,9 @@ class KnowledgeTool:
         name = re.sub(r'(手册|指南|话术|v\d+|\d+)', '', name)
         return name.strip()
     
-    def _parse_pdf(self, file_path: Path) -> str:
-        """解析 PDF 文件"""
-        try:
-            import PyPDF2
-            text = ""
-            with open(file_path, 'rb') as f:
-                reader = PyPDF2.PdfReader(f)
-                for page in reader.pages:
-                    text += page.extract_text() + "\n"
-            return text
-        except ImportError:
-            return f"[PDF解析需要PyPDF2] {file_path}"
-    
-    def _parse_docx(self, file_path: Path) -> str:
-        """解析 Word 文件"""
-        try:
-            from docx import Document
-            doc = Document(file_path)
-            return "\n".join([para.text for para in doc.paragraphs])
-        except ImportError:
-            return f"[Word解析需要python-docx] {file_path}"
-    
-    def _parse_markdown(self, file_path: Path) -> str:
-        """解析 Markdown 文件"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    
-    def _parse_text(self, file_path: Path) -> str:
-        """解析文本文件"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    
-    def _extract_knowledge(self, content: str, project_name: str) -> dict:
-        """从文本中提取结构化知识"""
-        knowledge = {
-            'name': project_name,
-            'raw_content': content,
-            'introduction': '',
-            'indications': [],
-            'contraindications': [],
-            'price_range': '',
-            'duration': '',
-            'faq': [],
-            'objections': [],
-            'key_points': []
-        }
-        
-        # 使用简单规则提取，实际可用 NLP
-        lines = content.split('\n')
-        current_section = None
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-            
-            # 识别章节
-            if '介绍' in line or '简介' in line:
-                current_section = 'introduction'
-            elif '适应症' in line or '适合人群' in line:
-                current_section = 'indications'
-            elif '禁忌' in line:
-                current_section = 'contraindications'
-            elif '价格' in line or '费用' in line:
-                current_section = 'price'
-            elif '维持' in line or '效果' in line:
-                current_section = 'duration'
-            elif 'FAQ' in line or '常见问题' in line:
-                current_section = 'faq'
-            elif '异议' in line:
-                current_section = 'objections'
-            elif '要点' in line or '重点' in line:
-                current_section = 'key_points'
-            else:
-                # 收集内容
-                if current_section == 'introduction':
-                    knowledge['introduction'] += line + ' '
-                elif current_section == 'indications':
-                    if line.startswith(('•', '-', '*', '1.', '2.')):
-                        knowledge['indications'].append(line.lstrip('•-*0123456789. '))
-                elif current_section == 'contraindications':
-                    if line.startswith(('•', '-', '*', '1.', '2.')):
-                        knowledge['contraindications'].append(line.lstrip('•-*0123456789. '))
-                elif current_section == 'price':
-                    knowledge['price_range'] += line + ' '
-                elif current_section == 'duration':
-                    knowledge['duration'] += line + ' '
-                elif current_section == 'faq':
-                    # 简单解析 Q&A
-                    if '？' in line or '?' in line:
-                        knowledge['faq'].append({'question': line, 'answer': ''})
-                    elif knowledge['faq']:
-                        knowledge['faq'][-1]['answer'] += line + ' '
-                elif current_section == 'objections':
-                    # 解析异议类型和应对
-                    if '：' in line or ':' in line:
-                        parts = line.split('：', 1) if '：' in line else line.split(':', 1)
-                        knowledge['objections'].append({
-                            'type': parts[0].strip(),
-                            'response': parts[1].strip() if len(parts) > 1 else ''
-                        })
-                elif current_section == 'key_points':
-                    if line.startswith(('•', '-', '*')):
-                        knowledge['key_points'].append(line.lstrip('•-* '))
-        
-        return knowledge
-    
-    def _get_default_knowledge(self, project_name: str) -> dict:
+    def _get_default_knowledge(self, project_name: str) -> ProjectKnowledge:
         """获取默认知识（当知识库中不存在时）"""
-        return {
+        return ProjectKnowledge.from_dict({
             'name': project_name,
             'introduction': f'{project_name}是本院热门项目，深受顾客好评。',
             'indications': ['有改善需求的顾客'],
@@ -248,4 +488,140 @@ class KnowledgeTool:
                 {'type': '效果', 'response': '根据顾客反馈，满意度很高，我们也可以看看案例效果。'}
             ],
             'key_points': ['强调安全性', '展示案例', '了解需求']
-        }
+        })
+
+
+class ParsePipeline:
+    """
+    文档解析流水线
+    
+    文件分发到进程池并行解析（spawn 启动，避免继承后台线程持有的锁），
+    在途任务数不超过进程数，超时的文件记为失败并重建进程池，其余任务重新排队；
+    workers 为 0 时在当前进程串行解析（不限时）
+    """
+    
+    def __init__(self, workers: Optional[int] = None, timeout: float = 120):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.timeout = timeout
+    
+    def _start_pool(self, context, workers: int):
+        """启动进程池并预热（工作进程导入模块的耗时不计入单文件超时）"""
+        pool = context.Pool(workers)
+        pool.map(doc_parser.ping, range(workers), chunksize=1)
+        return pool
+    
+    def run(self, tasks: List[tuple]) -> Iterator[Tuple[str, tuple, Optional[dict], str, float]]:
+        """
+        解析文件
+        
+        Args:
+            tasks: [(相对路径, 文件路径, 项目名, 附加信息)]
+            
+        Yields:
+            (相对路径, 任务, 解析结果, 错误信息, 耗时秒数)，按完成顺序
+        """
+        if not tasks:
+            return
+        if not self.workers:
+            for task in tasks:
+                started = time.perf_counter()
+                try:
+                    knowledge, elapsed = doc_parser.parse_file(task[1], task[2])
+                    yield task[0], task, knowledge, '', elapsed
+                except Exception as e:
+                    yield task[0], task, None, str(e) or type(e).__name__, time.perf_counter() - started
+            return
+        
+        context = multiprocessing.get_context('spawn')
+        workers = min(self.workers, len(tasks))
+        pending = deque(tasks)
+        running = {}  # 相对路径 -> (任务, AsyncResult, 开始时间)
+        pool = self._start_pool(context, workers)
+        try:
+            while pending or running:
+                while pending and len(running) < workers:
+                    task = pending.popleft()
+                    running[task[0]] = (task, pool.apply_async(doc_parser.parse_file, (task[1], task[2])), time.monotonic())
+                
+                # 等待最早开始的任务，最多等到它超时
+                task, result, started = next(iter(running.values()))
+                result.wait(max(0.0, min(0.05, started + self.timeout - time.monotonic())))
+                
+                timed_out = False
+                now = time.monotonic()
+                for rel_path, (task, result, started) in list(running.items()):
+                    if result.ready():
+                        del running[rel_path]
+                        try:
+                            knowledge, elapsed = result.get()
+                            yield rel_path, task, knowledge, '', elapsed
+                        except Exception as e:
+                            yield rel_path, task, None, str(e) or type(e).__name__, now - started
+                    elif now - started > self.timeout:
+                        del running[rel_path]
+                        timed_out = True
+                        yield rel_path, task, None, f"解析超时（>{self.timeout}s）", now - started
+                
+                if timed_out:
+                    # 卡住的进程无法单独中止：重建进程池，未完成的任务重新排队
+                    pool.terminate()
+                    pool.join()
+                    for task, _, _ in running.values():
+                        pending.appendleft(task)
+                    running.clear()
+                    pool = self._start_pool(context, workers)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+def _doc_filter(docs: List[dict], project: Optional[str], department: Optional[str]) -> Optional[List[int]]:
+    """按项目、科室（含通用文档）筛选索引条目，无条件时返回 None"""
+    if not project and department is None:
+        return None
+    return [
+        i for i, doc in enumerate(docs)
+        if (not project or doc['project'] == project) and (department is None or doc['department'] in (department, ''))
+    ]
+
+
+def _byte_spans(text: str, spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """字符区间转为 UTF-8 字节区间 [(字节偏移, 字节数)]"""
+    offsets, position, nbytes = {}, 0, 0
+    for point in sorted({p for span in spans for p in span}):
+        nbytes += len(text[position:point].encode('utf-8'))
+        offsets[point] = nbytes
+        position = point
+    return [(offsets[start], offsets[end] - offsets[start]) for start, end in spans]
+
+
+class KnowledgeSyncScheduler(threading.Thread):
+    """后台同步线程：启动后立即同步一次，之后每 interval 秒同步（interval 为 0 时只同步一次）"""
+    
+    def __init__(self, tool: KnowledgeTool, interval: float):
+        super().__init__(name='knowledge-sync', daemon=True)
+        self.tool = tool
+        self.interval = interval
+        self._stop_event = threading.Event()
+    
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                print(f"[Knowledge] {self.tool.sync()}")
+            except Exception as e:
+                print(f"[Knowledge] 同步失败: {e}")
+            if not self.interval or self._stop_event.wait(self.interval):
+                break
+    
+    def stop(self):
+        self._stop_event.set()
+
+
+def _file_hash(file_path: Path) -> str:
+    """文件内容哈希（分块读取）"""
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
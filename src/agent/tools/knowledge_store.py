@@ -0,0 +1,282 @@
+"""
+知识库解析缓存 - 解析结果持久化到 SQLite（WAL），多个 worker 共享、按需加载
+
+知识按 医院(tenant) -> 科室(department) -> 项目(project) 分命名空间存放；
+内存中只保留结构化字段（slots 数据类），原文留在磁盘按偏移读取
+"""
+
+import json
+import sqlite3
+import sys
+import threading
+import zlib
+from collections.abc import Mapping
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# 表结构版本，升级时清空解析缓存（下次同步重新解析）
+SCHEMA_VERSION = 3
+
+
+@dataclass(slots=True)
+class FAQEntry:
+    question: str
+    answer: str
+
+
+@dataclass(slots=True)
+class ObjectionEntry:
+    type: str
+    response: str
+
+
+@dataclass(slots=True)
+class ProjectKnowledge:
+    """项目知识（不含原文，原文通过 KnowledgeStore.read_text 按需读取）"""
+    name: str
+    introduction: str = ''
+    indications: List[str] = field(default_factory=list)
+    contraindications: List[str] = field(default_factory=list)
+    price_range: str = ''
+    duration: str = ''
+    faq: List[FAQEntry] = field(default_factory=list)
+    objections: List[ObjectionEntry] = field(default_factory=list)
+    key_points: List[str] = field(default_factory=list)
+    rel_path: str = ''       # 原文所在文件，为空表示没有原文（默认知识）
+    raw_length: int = 0      # 原文字节数
+    nbytes: int = 0          # 内存占用估算
+
+    @classmethod
+    def from_dict(cls, data: dict, rel_path: str = '', raw_length: int = 0) -> 'ProjectKnowledge':
+        knowledge = cls(
+            name=data['name'],
+            introduction=data.get('introduction', ''),
+            indications=list(data.get('indications', [])),
+            contraindications=list(data.get('contraindications', [])),
+            price_range=data.get('price_range', ''),
+            duration=data.get('duration', ''),
+            faq=[FAQEntry(f['question'], f['answer']) for f in data.get('faq', [])],
+            objections=[ObjectionEntry(o['type'], o['response']) for o in data.get('objections', [])],
+            key_points=list(data.get('key_points', [])),
+            rel_path=rel_path,
+            raw_length=raw_length
+        )
+        knowledge.nbytes = deep_size(knowledge)
+        return knowledge
+
+
+def deep_size(obj, seen: Optional[set] = None) -> int:
+    """对象及其引用的字符串、容器、数据类 / 普通对象属性的内存占用估算（字节）"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, '__slots__'):
+        size += sum(deep_size(getattr(obj, f.name), seen) for f in fields(obj))
+    elif hasattr(obj, '__dict__'):
+        size += deep_size(vars(obj), seen)
+    return size
+
+
+class KnowledgeStore:
+    """
+    解析结果存储
+
+    files 表即同步清单（路径、命名空间、mtime、大小、内容哈希、项目名），
+    data 列为 zlib 压缩的结构化知识 JSON，只在访问该项目时读取；
+    raw 列为原文（UTF-8，不压缩），按字节偏移读取片段；
+    meta.generation 在内容变化时递增，其他 worker 据此发现变更
+    """
+
+    def __init__(self, path: str, root: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+
+        conn = self._conn()
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            conn.execute("DROP TABLE IF EXISTS files")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                rel_path TEXT PRIMARY KEY,
+                tenant TEXT NOT NULL,
+                department TEXT NOT NULL,
+                project TEXT NOT NULL,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                hash TEXT NOT NULL,
+                data BLOB NOT NULL,
+                raw BLOB NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_files_tenant ON files (tenant)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.commit()
+
+        # 知识库目录变更后旧结果作废
+        root = str(Path(root).resolve())
+        with conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'root'").fetchone()
+            if row is None or row[0] != root:
+                conn.execute("DELETE FROM files")
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('root', ?)", (root,))
+                self._bump_generation(conn)
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程一个连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _bump_generation(self, conn: sqlite3.Connection):
+        conn.execute("""
+            INSERT INTO meta (key, value) VALUES ('generation', '1')
+            ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+        """)
+
+    def generation(self) -> int:
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return int(row[0]) if row else 0
+
+    def manifest(self, tenant: Optional[str] = None) -> Dict[str, dict]:
+        """
+        同步清单（不含解析结果）：{相对路径: {tenant, department, project, mtime, size, hash}}
+
+        Args:
+            tenant: 只返回该医院的文件（可选）
+        """
+        sql = "SELECT rel_path, tenant, department, project, mtime, size, hash FROM files"
+        params = ()
+        if tenant is not None:
+            sql += " WHERE tenant = ?"
+            params = (tenant,)
+        return {
+            rel_path: {'tenant': t, 'department': d, 'project': project, 'mtime': mtime, 'size': size, 'hash': digest}
+            for rel_path, t, d, project, mtime, size, digest in self._conn().execute(sql, params)
+        }
+
+    def load(self, rel_path: str) -> Optional[ProjectKnowledge]:
+        """读取单个文件的结构化知识（不含原文）"""
+        row = self._conn().execute(
+            "SELECT data, length(raw) FROM files WHERE rel_path = ?", (rel_path,)
+        ).fetchone()
+        if row is None:
+            return None
+        return ProjectKnowledge.from_dict(json.loads(zlib.decompress(row[0])), rel_path, row[1])
+
+    def read_text(self, rel_path: str, offset: int = 0, length: Optional[int] = None) -> str:
+        """
+        按字节偏移读取原文片段（增量 BLOB 读取，不加载整篇）
+
+        Args:
+            rel_path: 文件相对路径
+            offset: 起始字节
+            length: 字节数，默认读到末尾
+        """
+        conn = self._conn()
+        row = conn.execute("SELECT rowid, length(raw) FROM files WHERE rel_path = ?", (rel_path,)).fetchone()
+        if row is None or not row[1] or offset >= row[1]:
+            return ''
+        with conn.blobopen('files', 'raw', row[0], readonly=True) as blob:
+            blob.seek(offset)
+            data = blob.read(-1 if length is None else length)
+        return data.decode('utf-8', errors='ignore')
+
+    def apply(self, parsed: List[Tuple[str, dict, dict]], touched: List[Tuple[str, float, int]],
+              removed: List[str]):
+        """
+        在一个事务内写入同步结果
+
+        Args:
+            parsed: [(相对路径, {tenant, department, project, mtime, size, hash}, 解析结果)]，
+                    解析结果中的 raw_content 单独存入 raw 列
+            touched: [(相对路径, mtime, size)]，内容未变只更新元数据
+            removed: [相对路径]
+        """
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO files (rel_path, tenant, department, project, mtime, size, hash, data, raw)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (rel_path, meta['tenant'], meta['department'], meta['project'],
+                     meta['mtime'], meta['size'], meta['hash'],
+                     zlib.compress(json.dumps(
+                         {k: v for k, v in knowledge.items() if k != 'raw_content'}, ensure_ascii=False
+                     ).encode('utf-8')),
+                     knowledge.get('raw_content', '').encode('utf-8'))
+                    for rel_path, meta, knowledge in parsed
+                ]
+            )
+            conn.executemany("UPDATE files SET mtime = ?, size = ? WHERE rel_path = ?",
+                             [(mtime, size, rel_path) for rel_path, mtime, size in touched])
+            conn.executemany("DELETE FROM files WHERE rel_path = ?", [(p,) for p in removed])
+            if parsed or removed:
+                self._bump_generation(conn)
+
+
+class KnowledgeCache(Mapping):
+    """
+    单个医院的项目知识缓存（只读映射）：(科室, 项目名) -> ProjectKnowledge
+
+    构建时只持有清单，首次访问某个项目时才从存储读取并解压；
+    同一科室下的同名项目以路径排序靠后的文件为准
+    """
+
+    def __init__(self, store: KnowledgeStore, manifest: Dict[str, dict]):
+        self._store = store
+        self._paths = {
+            (manifest[p]['department'], manifest[p]['project']): p for p in sorted(manifest)
+        }
+        self._loaded: Dict[Tuple[str, str], ProjectKnowledge] = {}
+
+    def __getitem__(self, key: Tuple[str, str]) -> ProjectKnowledge:
+        knowledge = self._loaded.get(key)
+        if knowledge is None:
+            knowledge = self._store.load(self._paths[key])
+            if knowledge is None:
+                raise KeyError(key)
+            self._loaded[key] = knowledge
+        return knowledge
+
+    def __contains__(self, key) -> bool:
+        return key in self._paths
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        return iter(self._paths)
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    @property
+    def loaded(self) -> Dict[Tuple[str, str], ProjectKnowledge]:
+        """已加载的项目"""
+        return dict(self._loaded)
+
+
+class TenantKnowledge:
+    """一个医院的知识命名空间：项目缓存 + 检索索引（首次查询时构建）"""
+
+    def __init__(self, tenant: str, cache: KnowledgeCache):
+        self.tenant = tenant
+        self.cache = cache
+        self.index = None
+        self.index_bytes = 0
+        self.index_lock = threading.Lock()
+
+    @property
+    def memory_bytes(self) -> int:
+        """内存占用估算：已加载的项目知识 + 检索索引"""
+        return sum(k.nbytes for k in self.cache.loaded.values()) + self.index_bytes
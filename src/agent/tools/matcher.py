@@ -0,0 +1,76 @@
+"""
+多模式匹配 - Aho-Corasick 自动机，一次扫描找出所有关键词
+"""
+
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+
+class KeywordMatcher:
+    """
+    关键词匹配器
+
+    构建时编译全部关键词，匹配耗时只与文本长度（和命中数）相关，
+    与关键词数量无关；重叠的关键词（如"绝对"与"绝对有效"）都会命中
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = sorted({kw for kw in keywords if kw})
+
+        # goto[state][char] -> state；output[state] 为在该状态结束的关键词
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[str, ...]] = [()]
+
+        for kw in self.keywords:
+            state = 0
+            for ch in kw:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = nxt
+            self._output[state] += (kw,)
+
+        # BFS 构建失败指针，并合并后缀状态的输出
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._output[nxt] += self._output[self._fail[nxt]]
+
+    def find_all(self, text: str) -> List[Tuple[int, str]]:
+        """
+        查找所有命中
+
+        Returns:
+            [(起始位置, 关键词)]，按结束位置排序
+        """
+        hits = []
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for kw in output[state]:
+                hits.append((i - len(kw) + 1, kw))
+        return hits
+
+    def scan(self, text: str) -> Dict[str, List[int]]:
+        """查找所有命中，按关键词分组：{关键词: [起始位置]}"""
+        hits: Dict[str, List[int]] = {}
+        for pos, kw in self.find_all(text):
+            hits.setdefault(kw, []).append(pos)
+        return hits
+
+    def __len__(self) -> int:
+        return len(self.keywords)
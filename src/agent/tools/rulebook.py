@@ -0,0 +1,232 @@
+"""
+评估规则库 - 从 YAML 加载评分规则并编译为内存规则引擎
+"""
+
+import hashlib
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+from .matcher import KeywordMatcher
+
+
+class RulebookError(Exception):
+    """规则库格式错误"""
+
+
+# 规则库结构：NUMBER 数值，TEXT 字符串，WORDS 字符串列表，PATTERN 正则；
+# 键名以 ? 结尾为可选，'*' 匹配其余任意键，[结构] 为列表（每项同一结构）
+NUMBER, TEXT, WORDS, PATTERN = 'number', 'text', 'words', 'pattern'
+
+RULES_SCHEMA = {
+    'professionalism': {
+        'base': NUMBER, 'max': NUMBER, 'term_bonus': NUMBER, 'term_cap': NUMBER,
+        'terms': {'*': WORDS},
+        'default_terms': WORDS,
+        'explanation': {'words': WORDS, 'bonus': NUMBER},
+        'data': {'pattern': PATTERN, 'bonus': NUMBER},
+    },
+    'empathy': {
+        'base': NUMBER, 'max': NUMBER, 'min': NUMBER,
+        'words': WORDS, 'word_bonus': NUMBER, 'word_cap': NUMBER,
+        'concern_response': {'concern_words': WORDS, 'response_words': WORDS, 'bonus': NUMBER},
+        'tone': {'words': WORDS, 'bonus': NUMBER},
+        'negative': {'words': WORDS, 'penalty': NUMBER},
+    },
+    'conversion': {
+        'base': NUMBER, 'max': NUMBER,
+        'signals': {'words': WORDS, 'bonus': NUMBER},
+        'next_step': {'words': WORDS, 'bonus': NUMBER},
+        'objection': {'words': WORDS, 'min_response_length': NUMBER, 'bonus': NUMBER},
+        'closing': {'words': WORDS, 'bonus': NUMBER},
+    },
+    'compliance': {
+        'base': NUMBER, 'min': NUMBER, 'sensitive_penalty': NUMBER,
+        'extra_sensitive_words?': WORDS,
+        'absolute': {'words': WORDS, 'penalty': NUMBER},
+        'efficacy_promises': {'words': WORDS, 'penalty': NUMBER},
+    },
+    'highlights': {
+        # 每条规则 words 与 pattern 至少有一个
+        'rules': [{'words?': WORDS, 'pattern?': PATTERN, 'text': TEXT}],
+        'default': TEXT,
+    },
+    'improvements': {
+        'rules': [{'dimension': TEXT, 'below': NUMBER, 'text': TEXT}],
+        'default': TEXT,
+    },
+    'suggestions': {'default': TEXT, '*': TEXT},
+}
+
+
+def _validate(node, schema, path: str):
+    """按 RULES_SCHEMA 校验规则（编译前），不符合时抛出 RulebookError 并指明位置"""
+    if isinstance(schema, dict):
+        if not isinstance(node, dict):
+            raise RulebookError(f"规则库格式错误: {path} 应为字典")
+        known = set()
+        for key, sub in schema.items():
+            if key == '*':
+                continue
+            name = key.rstrip('?')
+            known.add(name)
+            if name in node:
+                _validate(node[name], sub, f"{path}.{name}")
+            elif not key.endswith('?'):
+                raise RulebookError(f"规则库缺少配置: {path}.{name}")
+        for key, value in node.items():
+            if key in known:
+                continue
+            if '*' not in schema:
+                raise RulebookError(f"规则库包含未知配置: {path}.{key}")
+            _validate(value, schema['*'], f"{path}.{key}")
+    elif isinstance(schema, list):
+        if not isinstance(node, list):
+            raise RulebookError(f"规则库格式错误: {path} 应为列表")
+        for i, item in enumerate(node):
+            _validate(item, schema[0], f"{path}[{i}]")
+    elif schema == NUMBER:
+        if isinstance(node, bool) or not isinstance(node, (int, float)):
+            raise RulebookError(f"规则库格式错误: {path} 应为数值")
+    elif schema == TEXT:
+        if not isinstance(node, str):
+            raise RulebookError(f"规则库格式错误: {path} 应为字符串")
+    elif schema == WORDS:
+        if not isinstance(node, list) or not all(isinstance(word, str) for word in node):
+            raise RulebookError(f"规则库格式错误: {path} 应为字符串列表")
+    elif schema == PATTERN:
+        if not isinstance(node, str):
+            raise RulebookError(f"规则库格式错误: {path} 应为正则字符串")
+        try:
+            re.compile(node)
+        except re.error as e:
+            raise RulebookError(f"规则库格式错误: {path} 正则无效: {e}")
+
+
+class Rulebook:
+    """
+    编译后的规则库（只读）
+
+    编译时词表转为 frozenset、正则预编译，全部关键词合并进一个匹配器；
+    热更新时整体替换实例，评估过程中持有的旧实例不受影响
+    """
+
+    SECTIONS = tuple(RULES_SCHEMA)
+
+    def __init__(self, rules: dict, version: str = ''):
+        self.version = version
+        if not isinstance(rules, dict):
+            raise RulebookError("规则库格式错误: 顶层应为字典")
+        missing = [s for s in self.SECTIONS if s not in rules]
+        if missing:
+            raise RulebookError(f"规则库缺少章节: {', '.join(missing)}")
+        # 编译前逐章节校验键名与类型，错误的文件整体拒绝（加载器继续使用上一版规则）
+        for section in self.SECTIONS:
+            _validate(rules[section], RULES_SCHEMA[section], section)
+        for i, rule in enumerate(rules['highlights']['rules']):
+            if 'words' not in rule and 'pattern' not in rule:
+                raise RulebookError(f"规则库缺少配置: highlights.rules[{i}] 需要 words 或 pattern")
+
+        self._keywords = set()
+        try:
+            compiled = {section: self._compile(rules[section]) for section in self.SECTIONS}
+        except (re.error, TypeError, AttributeError) as e:
+            raise RulebookError(f"规则库格式错误: {e}")
+
+        self.professionalism: dict = compiled['professionalism']
+        self.empathy: dict = compiled['empathy']
+        self.conversion: dict = compiled['conversion']
+        self.compliance: dict = compiled['compliance']
+        self.highlights: dict = compiled['highlights']
+        self.improvements: dict = compiled['improvements']
+        self.suggestions: dict = compiled['suggestions']
+
+        self.extra_sensitive_words = self.compliance.get('extra_sensitive_words', frozenset())
+        self._keywords = frozenset(self._keywords)
+        self.matcher = KeywordMatcher(self._keywords)
+        # 敏感词来自调用参数，按词表缓存合并后的匹配器
+        self._matchers: Dict[Tuple[str, ...], KeywordMatcher] = {}
+        self._matchers_lock = threading.Lock()
+
+    def _compile(self, node):
+        """字符串列表 -> frozenset，pattern -> 正则，其余原样递归"""
+        if isinstance(node, dict):
+            return {
+                key: re.compile(value) if key == 'pattern' else self._compile(value)
+                for key, value in node.items()
+            }
+        if isinstance(node, list):
+            if all(isinstance(item, str) for item in node):
+                words = frozenset(node)
+                self._keywords.update(words)
+                return words
+            return [self._compile(item) for item in node]
+        return node
+
+    def matcher_for(self, sensitive_words: List[str]) -> KeywordMatcher:
+        """获取包含敏感词的匹配器（同一词表只编译一次）"""
+        key = tuple(sensitive_words)
+        matcher = self._matchers.get(key)
+        if matcher is None:
+            matcher = KeywordMatcher(self._keywords.union(sensitive_words))
+            with self._matchers_lock:
+                self._matchers[key] = matcher
+        return matcher
+
+    @classmethod
+    def load(cls, path: Path) -> 'Rulebook':
+        """从 YAML 文件加载"""
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            rules = yaml.safe_load(data.decode('utf-8'))
+        except (OSError, UnicodeDecodeError, yaml.YAMLError) as e:
+            raise RulebookError(f"规则库读取失败: {e}")
+        # 版本为内容哈希，多个 worker 间一致
+        return cls(rules, version=hashlib.sha1(data).hexdigest()[:12])
+
+
+class RulebookLoader:
+    """规则库加载器，按修改时间热更新"""
+
+    def __init__(self, path: str, check_interval: float = 2.0):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._mtime = self._stat()
+        self._rulebook = Rulebook.load(self.path)
+        self._next_check = time.monotonic() + check_interval
+        self._lock = threading.Lock()
+
+    def _stat(self) -> Optional[float]:
+        try:
+            return self.path.stat().st_mtime
+        except OSError:
+            return None
+
+    def get(self) -> Rulebook:
+        """获取当前规则库（文件变更时重新编译并原子替换）"""
+        now = time.monotonic()
+        if now >= self._next_check and self._lock.acquire(blocking=False):
+            try:
+                self._next_check = now + self.check_interval
+                mtime = self._stat()
+                if mtime is not None and mtime != self._mtime:
+                    self._mtime = mtime
+                    self.reload()
+            finally:
+                self._lock.release()
+        return self._rulebook
+
+    def reload(self) -> bool:
+        """重新加载，失败时保留当前规则库"""
+        try:
+            self._rulebook = Rulebook.load(self.path)
+        except RulebookError as e:
+            print(f"[Rulebook] {e}，继续使用上一版规则")
+            return False
+        print(f"[Rulebook] 已重新加载 {self.path}")
+        return True
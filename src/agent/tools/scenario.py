@@ -1,15 +1,32 @@
 """
 场景生成工具 - 生成训练场景和患者角色
+
+每次生成使用独立的随机数生成器（不共享全局 random 状态）：
+同一 (项目, 性格, 难度, 种子) 总是得到同一场景，场景 ID 为内容哈希
 """
 
+import os
 import random
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
+
+from .dialogue_fsm import DialogueMachine
+from .scenario_catalog import ScenarioCatalog, scenario_id
+
+
+def new_seed() -> int:
+    """随机种子（48 位，JSON 与前端可安全表示）"""
+    return int.from_bytes(os.urandom(6), 'big')
 
 
 class ScenarioTool:
     """场景生成工具"""
     
-    def __init__(self):
+    def __init__(self, catalog: Optional[ScenarioCatalog] = None):
+        # 场景目录（可选），已生成的场景从目录读取
+        self.catalog = catalog
+        # 编译好的对话状态机：(性格, 阶段序列) -> DialogueMachine
+        self._machines: Dict[Tuple[str, Tuple[str, ...]], DialogueMachine] = {}
+        
         # 患者姓名库
         self.female_names = ['李女士', '王女士', '张女士', '陈女士', '刘女士', '赵女士', '孙女士', '周女士']
         self.male_names = ['李先生', '王先生', '张先生', '陈先生', '刘先生', '赵先生', '孙先生', '周先生']
@@ -77,7 +94,20 @@ class ScenarioTool:
             }
         }
     
-    def generate(self, project: str, user_weakness: List[str], difficulty: str = 'medium') -> Dict:
+    def choose_personality(self, user_weakness: List[str], rng: Optional[random.Random] = None) -> str:
+        """根据用户薄弱点选择患者性格，无明确对应时随机"""
+        if user_weakness:
+            # 针对薄弱点生成场景
+            if '价格' in str(user_weakness):
+                return '价格敏感型'
+            elif '异议' in str(user_weakness):
+                return '犹豫型'
+            elif '促成' in str(user_weakness):
+                return '理性型'
+        return (rng or random.Random()).choice(list(self.personalities.keys()))
+    
+    def generate(self, project: str, user_weakness: List[str], difficulty: str = 'medium',
+                 personality: Optional[str] = None, seed: Optional[int] = None) -> Dict:
         """
         生成训练场景
         
@@ -85,23 +115,23 @@ class ScenarioTool:
             project: 项目名称
             user_weakness: 用户薄弱环节
             difficulty: 难度级别 easy/medium/hard
+            personality: 指定患者性格（可选，默认按薄弱点选择）
+            seed: 随机种子（可选，默认随机），相同参数与种子生成相同场景；
+                  指定种子时查找并登记场景目录，未指定（如预生成池补充）时不访问目录
             
         Returns:
-            场景配置
+            场景配置（含 scenario_id 与 seed）
         """
-        # 根据用户薄弱点选择患者性格
-        if user_weakness:
-            # 针对薄弱点生成场景
-            if '价格' in str(user_weakness):
-                personality_key = '价格敏感型'
-            elif '异议' in str(user_weakness):
-                personality_key = '犹豫型'
-            elif '促成' in str(user_weakness):
-                personality_key = '理性型'
-            else:
-                personality_key = random.choice(list(self.personalities.keys()))
-        else:
-            personality_key = random.choice(list(self.personalities.keys()))
+        requested = seed is not None and self.catalog is not None
+        if seed is None:
+            seed = new_seed()
+        rng = random.Random(seed)
+        personality_key = personality or self.choose_personality(user_weakness, rng)
+        
+        if requested:
+            cached = self.catalog.lookup(project, personality_key, difficulty, seed)
+            if cached is not None:
+                return cached
         
         personality = self.personalities[personality_key]
         
@@ -115,24 +145,24 @@ class ScenarioTool:
         
         # 根据项目选择性别倾向
         if project in ['玻尿酸']:
-            name = random.choice(self.female_names)
+            name = rng.choice(self.female_names)
         elif project in ['种植牙', '矫正']:
-            name = random.choice(random.choice([self.male_names, self.female_names]))
+            name = rng.choice(rng.choice([self.male_names, self.female_names]))
         else:
-            name = random.choice(self.female_names)
+            name = rng.choice(self.female_names)
         
-        age = random.randint(project_info['age_range'][0], project_info['age_range'][1])
-        concern = random.choice(project_info['concerns'])
+        age = rng.randint(project_info['age_range'][0], project_info['age_range'][1])
+        concern = rng.choice(project_info['concerns'])
         
         # 生成开场白
-        opening = self._generate_opening(name, age, project, concern, personality_key)
+        opening = self._generate_opening(name, age, project, concern, personality_key, rng)
         
         # 生成预期对话流程（给AI患者参考）
         expected_flow = self._generate_expected_flow(
             project, personality_key, project_info
         )
         
-        return {
+        scenario = {
             'patient': {
                 'name': name,
                 'age': age,
@@ -147,10 +177,28 @@ class ScenarioTool:
             'difficulty': difficulty,
             'opening': opening,
             'expected_flow': expected_flow,
-            'context': f"患者{name}，{age}岁，主要诉求是改善{concern}。性格属于{personality_key}，{random.choice(personality['traits'])}。"
+            'context': f"患者{name}，{age}岁，主要诉求是改善{concern}。性格属于{personality_key}，{rng.choice(personality['traits'])}。"
         }
+        scenario['scenario_id'] = scenario_id(scenario)
+        scenario['seed'] = seed
+        
+        if requested:
+            self.catalog.put(scenario, request=True)
+        return scenario
+    
+    def record(self, scenario: Dict):
+        """登记开始训练时实际使用的场景（后台写入），训练开场显示的场景编号可回放"""
+        if self.catalog is not None:
+            self.catalog.put(scenario)
+    
+    def replay(self, scenario_id: str) -> Optional[Dict]:
+        """按场景 ID 从目录取回场景（用于回放、A/B 对比），未收录时为 None"""
+        if self.catalog is None:
+            return None
+        return self.catalog.get(scenario_id)
     
-    def _generate_opening(self, name: str, age: int, project: str, concern: str, personality: str) -> str:
+    def _generate_opening(self, name: str, age: int, project: str, concern: str, personality: str,
+                          rng: random.Random) -> str:
         """生成患者开场白"""
         openings = {
             '犹豫型': [
@@ -175,7 +223,7 @@ class ScenarioTool:
             ]
         }
         
-        return random.choice(openings.get(personality, openings['犹豫型']))
+        return rng.choice(openings.get(personality, openings['犹豫型']))
     
     def _generate_expected_flow(self, project: str, personality: str, project_info: dict) -> List[Dict]:
         """生成预期对话流程"""
@@ -215,51 +263,37 @@ class ScenarioTool:
         
         return flow
     
-    def generate_follow_up(self, scenario: dict, turn: int, consultant_msg: str) -> str:
-        """
-        生成患者回应
-        
-        实际实现中应该调用 LLM，这里用规则模拟
+    def machine(self, personality: str, expected_flow: List[Dict]) -> DialogueMachine:
+        """获取 (性格, 阶段序列) 编译好的对话状态机（首次使用时编译）"""
+        key = (personality, tuple(step['stage'] for step in expected_flow))
+        machine = self._machines.get(key)
+        if machine is None:
+            machine = self._machines[key] = DialogueMachine(personality, key[1])
+        return machine
+    
+    def respond(self, scenario: dict, state: int, turn: int, consultant_msg: str) -> Tuple[str, int]:
         """
-        patient = scenario['patient']
-        personality = patient['personality']
+        按对话状态机生成患者回应
         
-        # 根据轮数和咨询师回复生成回应
-        if turn == 1:
-            # 第一轮：回应咨询师的询问
-            if personality == '价格敏感型':
-                return f"我主要是想改善{patient['concern']}，大概多少钱啊？"
-            elif personality == '犹豫型':
-                return f"{patient['concern']}困扰我很久了，但怕疼，也怕效果不好..."
-            else:
-                return f"{patient['concern']}比较明显，想了解一下{scenario['project']}的效果。"
+        随机选择由 (场景 ID, 轮数, 咨询师回复) 决定，回放同一对话得到相同回应
         
-        elif turn == 2:
-            # 第二轮：对介绍做出反应
-            if '价格' in consultant_msg or '钱' in consultant_msg:
-                return f"这个价格有点超预算，有没有优惠或者分期？"
-            elif '效果' in consultant_msg:
-                return f"能维持多久？需要经常补打吗？"
-            elif '安全' in consultant_msg or '放心' in consultant_msg:
-                return f"那具体怎么操作？疼不疼？"
-            else:
-                return random.choice(patient['questions'])
-        
-        elif turn == 3:
-            # 第三轮：提出异议或表达意向
-            if personality == '犹豫型':
-                return f"{random.choice(patient['objections'])}，我想再考虑考虑。"
-            elif personality == '价格敏感型':
-                return f"{random.choice(patient['objections'])}，能不能再便宜点？"
-            else:
-                return f"听起来不错，那什么时候可以安排？"
+        Args:
+            scenario: 场景
+            state: 当前状态（expected_flow 阶段序号）
+            turn: 轮数（从 1 开始）
+            consultant_msg: 咨询师回复
+            
+        Returns:
+            (患者回应, 下一状态)
+        """
+        rng = random.Random(f"{scenario.get('scenario_id', '')}:{turn}:{consultant_msg}")
+        machine = self.machine(scenario['patient']['personality'], scenario['expected_flow'])
+        return machine.step(state, consultant_msg, scenario, rng)
+    
+    def generate_follow_up(self, scenario: dict, turn: int, consultant_msg: str) -> str:
+        """
+        生成患者回应（规则模拟，不调用 LLM）
         
-        else:
-            # 结束轮
-            endings = [
-                "好的，那帮我预约吧。",
-                "行，那我先考虑一下，回头联系你。",
-                "可以，我想先看看案例再决定。",
-                f"这个价格还是有点贵，我再对比对比。"
-            ]
-            return random.choice(endings)
+        不跟踪状态时按轮数对应阶段，见 respond
+        """
+        return self.respond(scenario, turn - 1, turn, consultant_msg)[0]
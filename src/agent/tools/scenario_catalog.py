@@ -0,0 +1,225 @@
+"""
+场景目录 - 训练用过的场景持久化到 SQLite（WAL），按内容寻址去重、按种子复现；
+写入由后台线程批量提交，开始训练不等待落盘
+"""
+
+import hashlib
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenarios (
+    scenario_id TEXT PRIMARY KEY,
+    project TEXT NOT NULL,
+    personality TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scenario_requests (
+    project TEXT NOT NULL,
+    personality TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    scenario_id TEXT NOT NULL,
+    created_at REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (project, personality, difficulty, seed)
+);
+CREATE INDEX IF NOT EXISTS idx_scenarios_created ON scenarios (created_at);
+"""
+
+# 不参与内容哈希的字段
+_VOLATILE_FIELDS = ('scenario_id', 'seed')
+
+_STOP = object()
+
+logger = logging.getLogger(__name__)
+
+
+def scenario_id(scenario: dict) -> str:
+    """场景内容哈希（与生成所用种子无关，内容相同即 ID 相同）"""
+    content = {k: v for k, v in scenario.items() if k not in _VOLATILE_FIELDS}
+    data = json.dumps(content, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()[:16]
+
+
+class ScenarioCatalog:
+    """
+    场景目录
+
+    scenarios 表按场景 ID 保存内容（相同内容只存一份）；
+    scenario_requests 表记录 (项目, 性格, 难度, 种子) -> 场景 ID，
+    同一请求再次出现时直接返回已生成的场景；
+    场景数超过 max_scenarios 时删除最久未使用的场景及其请求记录
+    """
+
+    def __init__(self, path: str, max_scenarios: int = 10000, flush_interval: float = 0.2):
+        self.path = Path(path)
+        self.max_scenarios = max_scenarios
+        self.flush_interval = flush_interval
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        conn = self._conn()
+        # 旧库升级：请求记录补充时间列
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(scenario_requests)")]
+        if columns and 'created_at' not in columns:
+            conn.execute("ALTER TABLE scenario_requests ADD COLUMN created_at REAL NOT NULL DEFAULT 0")
+        conn.executescript(SCHEMA)
+
+        # 待写入的场景（写线程落盘前 get 仍可读到，保证刚显示的场景编号可回放）
+        self._pending: Dict[str, dict] = {}
+        self._pending_lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name='scenario-catalog-writer', daemon=True)
+        self._writer.start()
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程一个连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, scenario_id: str) -> Optional[dict]:
+        """按场景 ID 读取（用于回放）"""
+        with self._pending_lock:
+            pending = self._pending.get(scenario_id)
+        if pending is not None:
+            return {k: v for k, v in pending.items() if k != 'seed'}
+        row = self._conn().execute(
+            "SELECT data FROM scenarios WHERE scenario_id = ?", (scenario_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def lookup(self, project: str, personality: str, difficulty: str, seed: int) -> Optional[dict]:
+        """查找同一请求（含种子）已生成的场景"""
+        row = self._conn().execute("""
+            SELECT s.data FROM scenario_requests r JOIN scenarios s ON s.scenario_id = r.scenario_id
+            WHERE r.project = ? AND r.personality = ? AND r.difficulty = ? AND r.seed = ?
+        """, (project, personality, difficulty, seed)).fetchone()
+        with self._stats_lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if row is None:
+            return None
+        scenario = json.loads(row[0])
+        scenario['seed'] = seed
+        return scenario
+
+    def put(self, scenario: dict, request: bool = False):
+        """
+        登记场景（后台写入，不等待落盘）
+
+        Args:
+            scenario: 场景（含 scenario_id、seed）
+            request: 同时登记生成请求（调用方指定了种子时），同一请求再次出现时直接复用
+        """
+        with self._pending_lock:
+            self._pending[scenario['scenario_id']] = scenario
+            self._queue.put((scenario, request, time.time()))
+
+    def flush(self, timeout: float = 5.0):
+        """等待已登记的场景全部落盘"""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        """写入剩余场景并停止写线程"""
+        self._queue.put(_STOP)
+        self._writer.join(timeout=10)
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            batch, waiters, stop = [], [], False
+            deadline = time.time() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.time()))
+                except queue.Empty:
+                    break
+            try:
+                if batch:
+                    self._write(batch)
+            except Exception:
+                # 场景目录只用于复现与回放，写入失败不影响训练
+                logger.exception("场景目录写入失败，丢弃 %d 个场景", len(batch))
+            finally:
+                with self._pending_lock:
+                    for scenario, _, _ in batch:
+                        if self._pending.get(scenario['scenario_id']) is scenario:
+                            del self._pending[scenario['scenario_id']]
+                for waiter in waiters:
+                    waiter.set()
+            if stop:
+                return
+
+    def _write(self, batch: list):
+        conn = self._conn()
+        with conn:
+            for scenario, request, created_at in batch:
+                patient = scenario['patient']
+                data = {k: v for k, v in scenario.items() if k != 'seed'}
+                # 再次使用时刷新时间，清理时按最近使用保留
+                conn.execute(
+                    "INSERT INTO scenarios (scenario_id, project, personality, difficulty, data, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (scenario_id) DO UPDATE SET created_at = excluded.created_at",
+                    (scenario['scenario_id'], scenario['project'], patient['personality'], scenario['difficulty'],
+                     json.dumps(data, ensure_ascii=False), created_at)
+                )
+                if request:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO scenario_requests"
+                        " (project, personality, difficulty, seed, scenario_id, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                        (scenario['project'], patient['personality'], scenario['difficulty'], scenario['seed'],
+                         scenario['scenario_id'], created_at)
+                    )
+            if self.max_scenarios and conn.execute("SELECT COUNT(*) FROM scenarios").fetchone()[0] > self.max_scenarios:
+                self._prune(conn)
+
+    def _prune(self, conn: sqlite3.Connection):
+        """只保留最近使用的 max_scenarios 个场景，删除其余场景及指向它们的请求记录"""
+        cutoff = conn.execute(
+            "SELECT created_at FROM scenarios ORDER BY created_at DESC LIMIT 1 OFFSET ?", (self.max_scenarios - 1,)
+        ).fetchone()[0]
+        conn.execute(
+            "DELETE FROM scenario_requests WHERE scenario_id IN (SELECT scenario_id FROM scenarios WHERE created_at < ?)",
+            (cutoff,)
+        )
+        conn.execute("DELETE FROM scenarios WHERE created_at < ?", (cutoff,))
+
+    def stats(self) -> dict:
+        conn = self._conn()
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        return {
+            'scenarios': conn.execute("SELECT COUNT(*) FROM scenarios").fetchone()[0],
+            'requests': conn.execute("SELECT COUNT(*) FROM scenario_requests").fetchone()[0],
+            'max_scenarios': self.max_scenarios,
+            'hits': hits,
+            'misses': misses
+        }
@@ -0,0 +1,105 @@
+"""
+全文检索 - 倒排索引 + BM25 排序
+
+中文没有空格分词，按字切分：连续汉字取单字和相邻二字（bigram），
+英文、数字按整词，全部转小写
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+
+_TOKEN_PATTERN = re.compile(r'[一-鿿]+|[a-z0-9]+(?:\.[0-9]+)?')
+_CJK = re.compile(r'[一-鿿]')
+
+
+def tokenize(text: str) -> List[str]:
+    """切分词元：汉字单字 + 二字，英文数字整词"""
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(text.lower()):
+        if _CJK.match(run):
+            tokens.extend(run)
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+class SearchIndex:
+    """
+    倒排索引（构建后只读）
+
+    文档以整数 ID 索引，postings 记录 {词元: {文档ID: 词频}}，docs 保存文档原始条目；
+    查询只访问命中词元的倒排表，耗时与文档总数无关
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs: List[Any] = []
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._lengths: List[int] = []
+        self._total_length = 0
+
+    def add(self, text: str, doc: Any = None) -> int:
+        """加入文档（text 为索引文本，doc 为对应条目），返回文档 ID"""
+        doc_id = len(self._lengths)
+        tokens = tokenize(text)
+        for token, tf in Counter(tokens).items():
+            self._postings.setdefault(token, {})[doc_id] = tf
+        self.docs.append(doc)
+        self._lengths.append(len(tokens))
+        self._total_length += len(tokens)
+        return doc_id
+
+    def candidates(self, query: str) -> Set[int]:
+        """包含查询全部词元的文档（子串匹配的必要条件）"""
+        tokens = set(tokenize(query))
+        if not tokens:
+            return set()
+        postings = sorted((self._postings.get(t, {}) for t in tokens), key=len)
+        docs = set(postings[0])
+        for posting in postings[1:]:
+            docs.intersection_update(posting)
+            if not docs:
+                break
+        return docs
+
+    def search(self, query: str, top_k: int = 10,
+               doc_filter: Optional[Iterable[int]] = None) -> List[Tuple[int, float]]:
+        """
+        BM25 排序检索
+
+        Args:
+            query: 查询文本
+            top_k: 返回结果数量
+            doc_filter: 只在这些文档中排序（可选）
+
+        Returns:
+            [(文档ID, 得分)]，按得分降序
+        """
+        n = len(self._lengths)
+        if not n:
+            return []
+        allowed = set(doc_filter) if doc_filter is not None else None
+        avg_length = self._total_length / n or 1
+
+        scores: Dict[int, float] = {}
+        for token, qtf in Counter(tokenize(query)).items():
+            posting = self._postings.get(token)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, tf in posting.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + qtf * idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:top_k]
+
+    def __len__(self) -> int:
+        return len(self._lengths)
@@ -0,0 +1,173 @@
+"""
+向量检索 - 知识片段的哈希 TF-IDF 向量与余弦相似度 top-k 检索
+
+纯 CPU、无需模型文件：词元（见 search_index.tokenize）哈希到固定维度，
+按 TF-IDF 加权后 L2 归一化。安装 numpy 时向量存为 float32 矩阵，
+查询为一次矩阵乘法（可批量）；否则退回按维度倒排的稀疏计算
+"""
+
+import math
+import re
+import zlib
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .search_index import tokenize
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖
+    np = None
+
+
+def chunk_spans(text: str, size: int = 200, overlap: int = 40) -> List[Tuple[int, int]]:
+    """
+    切分文本片段，返回原文中的 [起, 止) 字符区间：按行累积到 size 字左右，
+    超长行按字数硬切，相邻片段保留 overlap 字重叠以免切断上下文
+    """
+    overlap = min(overlap, size // 2)
+    spans: List[Tuple[int, int]] = []
+    start = end = None
+    for match in re.finditer(r'[^\r\n]+', text):
+        line_start, line_end = match.start(), match.end()
+        if not clean_chunk(match.group()):
+            continue
+        if start is not None and line_end - start > size:
+            spans.append((start, end))
+            # 长行单独起片段，否则带上前一片段末尾的重叠
+            start = line_start if line_end - line_start > size - overlap else max(end - overlap, start)
+        if start is None:
+            start = line_start
+        while line_end - start > size:
+            spans.append((start, start + size))
+            start += size - overlap
+        end = line_end
+    if start is not None:
+        spans.append((start, end))
+    return spans
+
+
+def clean_chunk(text: str) -> str:
+    """片段原文转为展示文本：去掉 Markdown 标题符号，多行合并为一行"""
+    lines = (line.strip().lstrip('#').strip() for line in re.split(r'[\r\n]+', text))
+    return ' '.join(line for line in lines if line)
+
+
+def chunk_text(text: str, size: int = 200, overlap: int = 40) -> List[str]:
+    """切分文本片段（见 chunk_spans），返回展示文本"""
+    return [clean_chunk(text[a:b]) for a, b in chunk_spans(text, size, overlap)]
+
+
+class VectorIndex:
+    """
+    片段向量索引（构建后只读）
+
+    build() 一次性计算 IDF 和全部向量；search() 返回余弦相似度最高的 top_k 片段
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+        self.docs: List[Any] = []
+        self._idf: Dict[int, float] = {}
+        self._matrix = None                                  # numpy: (n, dim) float32
+        self._postings: Dict[int, List[Tuple[int, float]]] = {}  # 无 numpy: 维度 -> [(文档ID, 权重)]
+
+    def _hash(self, token: str) -> int:
+        return zlib.crc32(token.encode('utf-8')) % self.dim
+
+    def _counts(self, text: str) -> Counter:
+        return Counter(self._hash(token) for token in tokenize(text))
+
+    def _weigh(self, counts: Counter) -> Dict[int, float]:
+        """TF-IDF 加权并归一化（亚线性 TF）"""
+        vector = {
+            bucket: (1 + math.log(tf)) * self._idf.get(bucket, 0.0)
+            for bucket, tf in counts.items()
+        }
+        norm = math.sqrt(sum(w * w for w in vector.values()))
+        return {bucket: w / norm for bucket, w in vector.items() if w} if norm else {}
+
+    def build(self, texts: Sequence[str], docs: Optional[Sequence[Any]] = None) -> 'VectorIndex':
+        """构建索引，docs 为与 texts 一一对应的条目（默认为文本本身）"""
+        self.docs = list(docs) if docs is not None else list(texts)
+        counts = [self._counts(text) for text in texts]
+
+        n = len(counts)
+        df = Counter(bucket for c in counts for bucket in c)
+        self._idf = {bucket: math.log((1 + n) / (1 + freq)) + 1 for bucket, freq in df.items()}
+
+        vectors = [self._weigh(c) for c in counts]
+        if np is not None:
+            self._matrix = np.zeros((n, self.dim), dtype=np.float32)
+            for i, vector in enumerate(vectors):
+                if vector:
+                    self._matrix[i, list(vector)] = list(vector.values())
+        else:
+            self._postings = {}
+            for i, vector in enumerate(vectors):
+                for bucket, w in vector.items():
+                    self._postings.setdefault(bucket, []).append((i, w))
+        return self
+
+    def search(self, query: str, top_k: int = 3, min_score: float = 0.0,
+               doc_filter: Optional[Sequence[int]] = None) -> List[Tuple[int, float]]:
+        """
+        余弦相似度检索
+
+        Args:
+            query: 查询文本
+            top_k: 返回结果数量
+            min_score: 最低相似度
+            doc_filter: 只在这些片段中检索（可选）
+
+        Returns:
+            [(片段ID, 相似度)]，按相似度降序
+        """
+        return self.search_batch([query], top_k, min_score, doc_filter)[0]
+
+    def search_batch(self, queries: Sequence[str], top_k: int = 3, min_score: float = 0.0,
+                     doc_filter: Optional[Sequence[int]] = None) -> List[List[Tuple[int, float]]]:
+        """批量检索（numpy 下多个查询合并为一次矩阵乘法）"""
+        vectors = [self._weigh(self._counts(q)) for q in queries]
+        if not self.docs:
+            return [[] for _ in queries]
+
+        if np is not None:
+            q = np.zeros((len(vectors), self.dim), dtype=np.float32)
+            for i, vector in enumerate(vectors):
+                if vector:
+                    q[i, list(vector)] = list(vector.values())
+            matrix = self._matrix
+            ids = None
+            if doc_filter is not None:
+                ids = np.asarray(list(doc_filter), dtype=np.int64)
+                matrix = matrix[ids]
+            scores = q @ matrix.T
+            results = []
+            for row in scores:
+                k = min(top_k, len(row))
+                if k <= 0:
+                    results.append([])
+                    continue
+                top = np.argpartition(-row, k - 1)[:k]
+                top = top[np.argsort(-row[top], kind='stable')]
+                results.append([
+                    (int(ids[j]) if ids is not None else int(j), float(row[j]))
+                    for j in top if row[j] > min_score
+                ])
+            return results
+
+        allowed = set(doc_filter) if doc_filter is not None else None
+        results = []
+        for vector in vectors:
+            scores: Dict[int, float] = {}
+            for bucket, qw in vector.items():
+                for doc_id, w in self._postings.get(bucket, ()):
+                    if allowed is None or doc_id in allowed:
+                        scores[doc_id] = scores.get(doc_id, 0.0) + qw * w
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+            results.append([(doc_id, score) for doc_id, score in ranked[:top_k] if score > min_score])
+        return results
+
+    def __len__(self) -> int:
+        return len(self.docs)
@@ -0,0 +1,156 @@
+"""
+执行层 - 将同步 Agent 调用调度到有界线程池，避免阻塞事件循环；
+异步管线（等待 LLM 的请求）经准入限制控制并发与排队
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional
+
+
+class ExecutorSaturated(Exception):
+    """执行池已满（运行中 + 排队中 达到上限）"""
+
+
+class AgentExecutor:
+    """有界 Agent 执行池"""
+
+    def __init__(self, config: Optional[dict] = None):
+        config = config or {}
+        self.max_workers = config.get('max_workers', 8)
+        self.max_queue = config.get('max_queue', 32)
+        self.timeout = config.get('timeout', 60)
+
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix='agent-worker'
+        )
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """
+        在线程池中执行同步函数
+
+        Args:
+            func: 同步函数
+            *args, **kwargs: 函数参数
+
+        Returns:
+            函数返回值
+
+        Raises:
+            ExecutorSaturated: 运行中与排队中的任务总数已达上限
+            asyncio.TimeoutError: 执行超时
+        """
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise ExecutorSaturated("服务繁忙，请稍后再试")
+            self._in_flight += 1
+
+        try:
+            future = self._pool.submit(func, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        # 超时后线程仍在运行，计数在任务真正完成时才释放
+        future.add_done_callback(lambda _: self._release())
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def stats(self) -> dict:
+        """执行池状态"""
+        with self._lock:
+            in_flight = self._in_flight
+            rejected = self._rejected
+        return {
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'in_flight': in_flight,
+            'queued': max(0, in_flight - self.max_workers),
+            'rejected': rejected
+        }
+
+    def shutdown(self):
+        """关闭执行池"""
+        self._pool.shutdown(wait=False)
+
+
+class AsyncAdmission:
+    """
+    异步请求准入：最多 max_concurrent 个请求同时执行，
+    其余排队等待，排队数达到 max_queue 时拒绝（API 层返回 429）
+    """
+
+    def __init__(self, config: Optional[dict] = None):
+        config = config or {}
+        self.max_concurrent = config.get('async_max_concurrent', 64)
+        self.max_queue = config.get('async_max_queue', 128)
+        self.timeout = config.get('timeout', 60)
+
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._active = 0
+        self._waiting = 0
+        self._rejected = 0
+
+    async def acquire(self):
+        """
+        占用一个执行名额（名额已满时排队等待），用完须调用 release；
+        流式接口在整个响应期间占用名额
+
+        Raises:
+            ExecutorSaturated: 排队数已达上限
+        """
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            self._rejected += 1
+            raise ExecutorSaturated("服务繁忙，请稍后再试")
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self._active += 1
+
+    def release(self):
+        self._active -= 1
+        self._semaphore.release()
+
+    async def run(self, func: Callable[..., Awaitable], *args, **kwargs):
+        """
+        在准入限制下执行异步函数
+
+        Args:
+            func: 异步函数
+            *args, **kwargs: 函数参数
+
+        Returns:
+            函数返回值
+
+        Raises:
+            ExecutorSaturated: 排队数已达上限
+            asyncio.TimeoutError: 执行超时（含排队时间）
+        """
+        async def guarded():
+            await self.acquire()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.release()
+
+        return await asyncio.wait_for(guarded(), timeout=self.timeout)
+
+    def stats(self) -> dict:
+        """准入状态"""
+        return {
+            'max_concurrent': self.max_concurrent,
+            'max_queue': self.max_queue,
+            'active': self._active,
+            'queued': self._waiting,
+            'rejected': self._rejected
+        }
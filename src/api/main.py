@@ -3,16 +3,27 @@ FastAPI Web API - 话术演练场后端服务
 提供 API 接口和静态文件服务
 """
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+import asyncio
+import json
+import time
+from contextlib import aclosing
+import uuid
 import uvicorn
 import os
+from pathlib import Path
 
 from ..agent import get_agent
+from ..agent.batch_eval import RescoreJob
+from ..agent.ingest import IngestQueue
+from ..agent.session_store import SessionConflict
+from ..agent.tools.knowledge import DEFAULT_TENANT
+from .executor import AgentExecutor, AsyncAdmission, ExecutorSaturated
 
 # 获取当前文件所在目录
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -36,8 +47,76 @@ app.add_middleware(
 # 挂载静态文件目录
 app.mount("/static", StaticFiles(directory=WEBAPP_DIR), name="static")
 
-# 获取 Agent 实例
-agent = get_agent()
+# Agent 及执行池在服务启动时创建（导入本模块不创建 Agent：
+# spawn 进程池的工作进程会重新导入启动模块）
+agent = None
+# Agent 执行池（同步 Agent 调用不在事件循环中执行）
+executor: Optional[AgentExecutor] = None
+# 异步管线准入（等待 LLM 的请求不占线程，但同样限制并发与排队）
+admission: Optional[AsyncAdmission] = None
+# 知识库上传文件的后台解析队列
+ingest_queue: Optional[IngestQueue] = None
+
+# 上传分块大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+@app.on_event("startup")
+async def startup_agent():
+    global agent, executor, admission, ingest_queue
+    agent = get_agent()
+    executor = AgentExecutor(agent.config.get('executor'))
+    admission = AsyncAdmission(agent.config.get('executor'))
+    ingest_queue = IngestQueue(agent.knowledge_tool, agent.job_store)
+    ingest_queue.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    executor.shutdown()
+    if agent.session_sweeper is not None:
+        agent.session_sweeper.stop()
+    if agent.knowledge_tool.sync_scheduler is not None:
+        agent.knowledge_tool.sync_scheduler.stop()
+    if agent.scenario_pool is not None:
+        agent.scenario_pool.stop()
+    ingest_queue.stop()
+    agent.training_store.close()
+    agent.job_store.close()
+    if agent.scenario_tool.catalog is not None:
+        agent.scenario_tool.catalog.close()
+    if agent.response_cache is not None:
+        agent.response_cache.close()
+    if agent.llm is not None:
+        await agent.llm.aclose()
+
+
+async def run_agent(user_id: str, message: str, channel: str = "wecom") -> str:
+    """
+    处理消息：需要等待 LLM 的对话回复走异步管线（等待模型时不占线程），
+    其余消息在执行池中运行同步 Agent；池满或排队已满返回 429，超时返回 504，
+    会话已被其他 worker 上的请求更新时返回 409
+    """
+    try:
+        if agent.needs_llm(message):
+            return await admission.run(
+                agent.aprocess_message,
+                user_id=user_id,
+                message=message,
+                channel=channel
+            )
+        return await executor.run(
+            agent.process_message,
+            user_id=user_id,
+            message=message,
+            channel=channel
+        )
+    except ExecutorSaturated as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="处理超时，请稍后再试")
+    except SessionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
 
 # 数据模型
@@ -50,6 +129,13 @@ class MessageRequest(BaseModel):
 class TrainingStartRequest(BaseModel):
     user_id: str
     project: Optional[str] = None
+    seed: Optional[int] = None          # 场景随机种子，相同种子复现相同场景
+    scenario_id: Optional[str] = None   # 回放场景目录中的场景（优先于 seed）
+
+
+class RescoreRequest(BaseModel):
+    days: Optional[int] = None      # 只重评最近 N 天，不填为全部
+    workers: Optional[int] = None   # 进程数，不填为 CPU 核数
 
 
 # ========== Web 页面路由 ==========
@@ -85,6 +171,7 @@ async def api_root():
         "docs": "/docs",
         "endpoints": {
             "chat": "/api/chat",
+            "chat_stream": "/api/chat/stream",
             "training": "/api/training/start",
             "user": "/api/user/{user_id}",
             "team": "/api/team/{department}"
@@ -92,11 +179,61 @@ async def api_root():
     }
 
 
+@app.get("/api/system/executor")
+async def executor_stats():
+    """执行池与异步管线准入状态"""
+    return {**executor.stats(), 'async': admission.stats()}
+
+
+@app.get("/api/system/sessions")
+async def session_stats():
+    """训练会话统计（活跃数、淘汰数）"""
+    return agent.session_stats()
+
+
+@app.get("/api/system/knowledge-memory")
+async def knowledge_memory_stats():
+    """知识库内存占用（按医院、项目，单位字节）"""
+    return agent.knowledge_tool.memory_stats()
+
+
+@app.get("/api/system/responder")
+async def responder_stats():
+    """患者回应调度状态（LLM 回退率、熔断状态、延迟分位）"""
+    if agent.responder is None:
+        return {'enabled': False}
+    stats = {'enabled': True, **agent.responder.stats()}
+    if agent.response_cache is not None:
+        stats['cache'] = agent.response_cache.stats()
+    return stats
+
+
+@app.get("/api/system/scenario-pool")
+async def scenario_pool_stats():
+    """场景预生成池状态（命中率、各场景存量）与场景目录统计"""
+    if agent.scenario_pool is None:
+        stats = {'enabled': False}
+    else:
+        stats = {'enabled': True, **agent.scenario_pool.stats()}
+    if agent.scenario_tool.catalog is not None:
+        stats['catalog'] = agent.scenario_tool.catalog.stats()
+    return stats
+
+
+@app.get("/api/scenarios/{scenario_id}")
+async def get_scenario(scenario_id: str):
+    """场景目录中的场景详情（回放前查看）"""
+    scenario = agent.scenario_tool.replay(scenario_id)
+    if scenario is None:
+        raise HTTPException(status_code=404, detail=f"场景不存在: {scenario_id}")
+    return scenario
+
+
 @app.post("/api/chat")
 async def chat(request: MessageRequest):
     """主对话接口"""
     try:
-        response = agent.process_message(
+        response = await run_agent(
             user_id=request.user_id,
             message=request.message,
             channel=request.channel
@@ -106,29 +243,135 @@ async def chat(request: MessageRequest):
             "user_id": request.user_id,
             "response": response
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/chat/stream")
+async def chat_stream(request: MessageRequest):
+    """
+    流式对话接口（Server-Sent Events）
+    
+    事件类型：token（患者回应增量）、prompt（操作提示）、section（报告段落）、
+    message（完整回复）、error、done
+    
+    需要等待 LLM 的对话回复逐字推送，整个响应期间占用异步管线名额；
+    其余消息在执行池中处理，以一条 message 事件返回。排队已满返回 429
+    """
+    if not agent.needs_llm(request.message):
+        try:
+            event, response = "message", await run_agent(
+                user_id=request.user_id,
+                message=request.message,
+                channel=request.channel
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            event, response = "error", str(e)
+        
+        async def single_event():
+            yield sse_event(event, response)
+            yield sse_event("done", "")
+        
+        return event_response(single_event())
+    
+    try:
+        await asyncio.wait_for(admission.acquire(), timeout=admission.timeout)
+    except ExecutorSaturated as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="处理超时，请稍后再试")
+    
+    async def event_stream():
+        try:
+            async with aclosing(agent.astream_message(
+                user_id=request.user_id,
+                message=request.message,
+                channel=request.channel
+            )) as events:
+                async for event, data in events:
+                    yield sse_event(event, data)
+        except Exception as e:
+            yield sse_event("error", str(e))
+        yield sse_event("done", "")
+    
+    return AdmittedStreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def event_response(events) -> StreamingResponse:
+    """SSE 响应"""
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """占用异步管线名额的 SSE 响应：推送结束或客户端断开时关闭事件流（释放用户锁）并归还名额"""
+    
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            admission.release()
+
+
+def sse_event(event: str, data: str) -> str:
+    """编码一条 SSE 事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def run_start_training(request: TrainingStartRequest) -> Optional[str]:
+    """按种子或场景 ID 开始训练（不涉及 LLM，在执行池中运行）"""
+    kwargs = dict(user_id=request.user_id, project=request.project,
+                  seed=request.seed, scenario_id=request.scenario_id)
+    try:
+        return await executor.run(agent.start_training, **kwargs)
+    except ExecutorSaturated as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="处理超时，请稍后再试")
+
+
 @app.post("/api/training/start")
 async def start_training(request: TrainingStartRequest):
-    """开始训练"""
+    """开始训练（可指定 seed 或 scenario_id 复现场景）"""
     try:
-        message = f"我想练习{request.project}" if request.project else "我想练习"
-        response = agent.process_message(
-            user_id=request.user_id,
-            message=message
-        )
+        if request.seed is not None or request.scenario_id:
+            response = await run_start_training(request)
+            if response is None:
+                raise HTTPException(status_code=404, detail=f"场景不存在: {request.scenario_id}")
+        else:
+            message = f"我想练习{request.project}" if request.project else "我想练习"
+            response = await run_agent(
+                user_id=request.user_id,
+                message=message
+            )
         return {
             "success": True,
             "user_id": request.user_id,
             "scenario_started": True,
             "response": response
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/training/history/{user_id}")
+async def training_history(user_id: str):
+    """当前训练会话每轮的 token 数与 LLM 窗口占用"""
+    stats = agent.history_stats(user_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="没有进行中的训练")
+    return stats
+
+
 @app.post("/api/training/dialogue")
 async def continue_dialogue(request: MessageRequest):
     """继续对话"""
@@ -186,7 +429,7 @@ async def get_training_history(user_id: str, days: int = 7):
 @app.get("/api/team/{department}/dashboard")
 async def get_team_dashboard(department: str):
     """获取团队数据看板"""
-    return {
+    dashboard = {
         "department": department,
         "total_members": 15,
         "active_today": 12,
@@ -196,6 +439,17 @@ async def get_team_dashboard(department: str):
         "concerns": ["价格谈判整体较弱", "新咨询师练习不足"],
         "trend": [120, 135, 142, 156, 148, 130, 156]
     }
+    
+    # 有真实训练数据时使用日汇总
+    stats = agent.get_team_stats(department, days=7)
+    if stats['count']:
+        dashboard.update({
+            "avg_score": round(stats['avg_score'], 1),
+            "total_sessions_week": stats['count'],
+            "trend": [d['count'] for d in stats['daily']],
+            "dimensions": {dim: round(s['avg'], 1) for dim, s in stats['dimensions'].items()}
+        })
+    return dashboard
 
 
 @app.get("/api/team/{department}/members")
@@ -232,6 +486,73 @@ async def get_projects():
     }
 
 
+@app.get("/api/knowledge/search")
+async def search_knowledge(q: str, type: str = "faq", project: Optional[str] = None, top_k: int = 5,
+                           tenant: str = DEFAULT_TENANT, department: Optional[str] = None):
+    """全文检索 FAQ（type=faq）或异议话术（type=objection），按相关度排序"""
+    knowledge_tool = agent.knowledge_tool
+    if type == "faq":
+        results = knowledge_tool.search_faq(q, top_k=top_k, project=project, tenant=tenant, department=department)
+    elif type == "objection":
+        results = knowledge_tool.search_objections(q, top_k=top_k, project=project, tenant=tenant, department=department)
+    else:
+        raise HTTPException(status_code=400, detail="type 仅支持 faq 或 objection")
+    return {"query": q, "type": type, "results": results}
+
+
+@app.post("/api/knowledge/upload")
+async def upload_knowledge(file: UploadFile = File(...), tenant: str = Form(DEFAULT_TENANT),
+                           department: str = Form('')):
+    """上传话术文档：分块写入知识库目录后立即返回导入任务，解析和索引在后台进行"""
+    knowledge_tool = agent.knowledge_tool
+    filename = Path(file.filename or '').name
+    if Path(filename).suffix.lower() not in knowledge_tool.PARSERS:
+        raise HTTPException(status_code=400, detail=f"仅支持 {'、'.join(knowledge_tool.PARSERS)} 文件")
+    
+    # 按命名空间存放：医院/科室/文件，默认医院为 科室/文件
+    tenant, department = Path(tenant).name, Path(department).name
+    if tenant.startswith('.') or department.startswith('.'):
+        raise HTTPException(status_code=400, detail="医院或科室名称无效")
+    if tenant != DEFAULT_TENANT and not department:
+        raise HTTPException(status_code=400, detail="指定医院时需同时指定科室")
+    directory = knowledge_tool.knowledge_path
+    if tenant != DEFAULT_TENANT:
+        directory = directory / tenant
+    if department:
+        directory = directory / department
+    target = directory / filename
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # 先写临时文件（同步扫描会忽略），写完再替换，避免解析到不完整的文件
+    tmp_path = target.with_name(f".{filename}.{uuid.uuid4().hex[:8]}.part")
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > knowledge_tool.max_file_size:
+                    raise HTTPException(status_code=413, detail="文件超过大小限制")
+                await asyncio.to_thread(out.write, chunk)
+        os.replace(tmp_path, target)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    
+    job = await asyncio.to_thread(ingest_queue.submit, target, filename, size)
+    return job.to_dict()
+
+
+@app.get("/api/knowledge/jobs/{job_id}")
+async def get_ingest_job(job_id: str):
+    """查询知识库导入任务状态"""
+    job = await asyncio.to_thread(ingest_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+
 @app.get("/api/knowledge/scenarios/{project_id}")
 async def get_scenarios(project_id: str):
     """获取项目的训练场景"""
@@ -253,6 +574,35 @@ async def get_scenarios(project_id: str):
     }
 
 
+# ========== 管理 API ==========
+
+@app.post("/api/admin/rescore")
+async def start_rescore(request: RescoreRequest):
+    """按当前评分规则和敏感词重新评估历史训练记录（后台任务）"""
+    since = time.time() - request.days * 86400 if request.days else 0
+    job = RescoreJob(
+        agent.training_store,
+        agent.job_store,
+        agent.config['evaluation'],
+        agent.config['sensitive_words'],
+        since=since,
+        workers=request.workers
+    )
+    # 任务表中登记时检查（多个 worker 间互斥）
+    if not await asyncio.to_thread(job.start):
+        raise HTTPException(status_code=409, detail="已有重评分任务在运行")
+    return job.to_dict()
+
+
+@app.get("/api/admin/rescore/{job_id}")
+async def get_rescore_job(job_id: str):
+    """查询重评分任务进度"""
+    job = await asyncio.to_thread(agent.job_store.get, job_id, 'rescore')
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+
 # ========== 启动函数 ==========
 
 def start_server(host="0.0.0.0", port=8000, reload=True):